@@ -0,0 +1,57 @@
+"""
+Time query embeddings computed in-process.
+
+Embeds single queries (the retrieval hot path) and a batch of documents
+with HashingEmbeddingFunction, and with OnnxEmbeddingFunction when a model
+folder is given. No request is sent; compare with the ~200 ms of a remote
+embedding call.
+
+Usage:
+    python benchmarks/embedding_latency.py --onnx-model models/all-MiniLM-L6-v2
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from lib.embeddings import HashingEmbeddingFunction, OnnxEmbeddingFunction  # noqa: E402
+
+QUERY = "Which Pokemon game was released on the Game Boy in 1998?"
+DOCUMENT = (
+    "Pokemon Gold and Silver are role-playing video games developed by Game Freak "
+    "and published by Nintendo for the Game Boy Color. They introduced 100 new "
+    "species, a day and night cycle, and breeding. "
+) * 4
+
+
+def bench(name, embedding_function, queries: int, documents: int):
+    embedding_function([QUERY])  # warm up
+
+    started = time.perf_counter()
+    for _ in range(queries):
+        embedding_function([QUERY])
+    per_query = (time.perf_counter() - started) / queries
+
+    started = time.perf_counter()
+    embedding_function([DOCUMENT] * documents)
+    per_batch = time.perf_counter() - started
+
+    print(f"{name}: {per_query * 1e3:.2f} ms/query, "
+          f"{documents / per_batch:.0f} docs/s in a batch of {documents}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--documents", type=int, default=256)
+    parser.add_argument("--onnx-model", default=None)
+    args = parser.parse_args()
+
+    bench("hashing", HashingEmbeddingFunction(), args.queries, args.documents)
+    if args.onnx_model:
+        bench("onnx", OnnxEmbeddingFunction(args.onnx_model), args.queries, args.documents)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compare a new OpenAI client per LLM call with the shared client from lib.llm.
+
+By default the requests go to a local stand-in server that returns a canned
+completion, so the numbers only show client setup and connection overhead.
+Pass --base-url (and set OPENAI_API_KEY) to measure against a real endpoint,
+where every new connection also pays for a TLS handshake.
+
+Usage:
+    python benchmarks/llm_client_reuse.py --turns 200
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import OpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from lib.llm import LLM, get_client  # noqa: E402
+
+
+COMPLETION = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [{
+        "index": 0,
+        "finish_reason": "stop",
+        "message": {"role": "assistant", "content": "ok"},
+    }],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StandInHandler.lock:
+            StandInHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_turns(make_llm, turns: int) -> float:
+    started = time.perf_counter()
+    for _ in range(turns):
+        make_llm().invoke("ping")
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--base-url", default=None, help="Real endpoint to use instead of the stand-in server")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    api_key = os.getenv("OPENAI_API_KEY", "stand-in")
+
+    results = {}
+    for label, make_llm in (
+        # What Agent._llm_step used to do on every turn
+        ("new client per turn", lambda: LLM(client=OpenAI(api_key=api_key, base_url=base_url))),
+        ("shared client", lambda: LLM(client=get_client(api_key, base_url))),
+    ):
+        before = StandInHandler.connections
+        elapsed = run_turns(make_llm, args.turns)
+        results[label] = elapsed
+        connections = f", {StandInHandler.connections - before} connections" if server else ""
+        print(f"{label:>20}: {elapsed / args.turns * 1000:7.2f} ms/turn{connections}")
+
+    saved = results["new client per turn"] - results["shared client"]
+    print(f"{'saved':>20}: {saved / args.turns * 1000:7.2f} ms/turn")
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
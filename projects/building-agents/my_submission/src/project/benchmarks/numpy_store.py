@@ -0,0 +1,63 @@
+"""
+Time NumpyCollection queries, exact and with the IVF index.
+
+Fills two collections with the same clustered random vectors, one always
+searched exactly and one searched through IVF lists, then times single
+queries and reports the recall of IVF against the exact top-k.
+
+Usage:
+    python benchmarks/numpy_store.py --documents 50000 --dimensions 1536
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from lib.numpy_store import NumpyCollection  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=50_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--n-probe", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(100, args.dimensions))
+    vectors = centers[rng.integers(0, len(centers), args.documents)]
+    vectors = (vectors + 0.5 * rng.normal(size=vectors.shape)).astype(np.float32)
+    queries = vectors[rng.integers(0, args.documents, args.queries)]
+    queries = queries + 0.1 * rng.normal(size=queries.shape).astype(np.float32)
+    ids = [str(i) for i in range(args.documents)]
+
+    exact = NumpyCollection(ivf_threshold=args.documents + 1)
+    ivf = NumpyCollection(ivf_threshold=0, n_probe=args.n_probe)
+    for collection in (exact, ivf):
+        for start in range(0, args.documents, 10_000):
+            collection.upsert(ids[start:start + 10_000], embeddings=vectors[start:start + 10_000])
+    ivf.query(query_embeddings=queries[:1])  # trains the index
+
+    found = {}
+    for name, collection in (("exact", exact), ("ivf", ivf)):
+        started = time.perf_counter()
+        found[name] = [
+            collection.query(query_embeddings=[query], n_results=args.n_results)["ids"][0]
+            for query in queries
+        ]
+        elapsed = (time.perf_counter() - started) / args.queries
+        print(f"{name}: {elapsed * 1e3:.2f} ms/query")
+
+    recall = np.mean([
+        len(set(a) & set(b)) / args.n_results for a, b in zip(found["exact"], found["ivf"])
+    ])
+    print(f"ivf recall@{args.n_results}: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
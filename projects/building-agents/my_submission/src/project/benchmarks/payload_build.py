@@ -0,0 +1,64 @@
+"""
+Time LLM._build_payload for a conversation replayed on every turn.
+
+Builds a 50-message history (user, assistant with tool calls, tool results)
+and an LLM with 10 tools, then times building the request payload. No
+request is sent.
+
+Usage:
+    python benchmarks/payload_build.py --messages 50 --tools 10
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from lib.llm import LLM  # noqa: E402
+from lib.messages import AIMessage, SystemMessage, ToolMessage, UserMessage  # noqa: E402
+from lib.tooling import Tool, ToolCall  # noqa: E402
+
+
+def make_tool(i: int) -> Tool:
+    def search(query: str, limit: int = 5, platform: str = None, year: int = None) -> str:
+        return query
+    search.__doc__ = f"Search source number {i} for games matching a query"
+    return Tool(search, name=f"search_{i}")
+
+
+def make_history(size: int):
+    messages = [SystemMessage(content="You are a gaming research assistant.")]
+    turn = 0
+    while len(messages) < size:
+        turn += 1
+        call = ToolCall(
+            id=f"call_{turn}",
+            type="function",
+            function={"name": "search_0", "arguments": json.dumps({"query": f"question {turn}"})},
+        )
+        messages += [
+            UserMessage(content=f"Tell me about game number {turn}"),
+            AIMessage(content=None, tool_calls=[call]),
+            ToolMessage(content=json.dumps("result " * 50), tool_call_id=call.id, name="search_0"),
+            AIMessage(content="Here is what I found. " * 10),
+        ]
+    return messages[:size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--tools", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    llm = LLM(api_key="unused", tools=[make_tool(i) for i in range(args.tools)])
+    messages = make_history(args.messages)
+
+    best = min(timeit.repeat(lambda: llm._build_payload(messages), number=args.repeat, repeat=5))
+    print(f"{args.messages} messages, {args.tools} tools: {best / args.repeat * 1e6:.1f} us/payload")
+
+
+if __name__ == "__main__":
+    main()
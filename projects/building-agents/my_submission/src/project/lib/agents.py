@@ -1,11 +1,15 @@
-from typing import TypedDict, List, Optional, Union, TypeVar
+from typing import Callable, Dict, TypedDict, List, Optional, Union, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import json
+import time
 
-from lib.state_machine import StateMachine, Step, EntryPoint, Termination, Run
-from lib.llm import LLM
-from lib.messages import AIMessage, UserMessage, SystemMessage, ToolMessage
+from lib.state_machine import StateMachine, Step, EntryPoint, Termination, Run, Resource
+from lib.llm import LLM, Prompt
+from lib.messages import AIMessage, SystemMessage, ToolMessage
 from lib.tooling import Tool, ToolCall
 from lib.memory import ShortTermMemory
+from lib.context import ContextManager
 
 # Define the state schema
 class AgentState(TypedDict):
@@ -14,13 +18,25 @@ class AgentState(TypedDict):
     messages: List[dict]  # List of conversation messages
     current_tool_calls: Optional[List[ToolCall]]  # Current pending tool calls
     total_tokens: int  # Track the cumulative total
+    cached_tokens: int  # Prompt tokens served from the provider's prompt cache
+    cost: float  # USD spent on LLM calls in this run
+    llm_time: float  # Seconds spent waiting for the LLM in this run
+    tool_time: float  # Seconds spent executing tools in this run
+    iterations: int  # Tool rounds executed in this run
+    started_at: float  # Wall-clock start of the run (time.time())
+    stop_reason: Optional[str]  # Limit that forced the final answer, if any
     
 class Agent:
     def __init__(self, 
                  model_name: str,
                  instructions: str, 
                  tools: List[Tool] = None,
-                 temperature: float = 0.7):
+                 temperature: float = 0.7,
+                 max_iterations: Optional[int] = 10,
+                 max_tokens: Optional[int] = None,
+                 max_time: Optional[float] = None,
+                 max_tool_workers: int = 8,
+                 context_manager: Optional[ContextManager] = None):
         """
         Initialize an Agent
         
@@ -29,47 +45,87 @@ class Agent:
             instructions: System instructions for the agent
             tools: Optional list of tools available to the agent
             temperature: Temperature parameter for LLM (default: 0.7)
+            max_iterations: Maximum tool rounds per run (default: 10, None for no limit)
+            max_tokens: Maximum total tokens per run (None for no limit)
+            max_time: Maximum seconds per run (None for no limit)
+            max_tool_workers: Maximum tool calls executed at the same time (default: 8)
+            context_manager: Optional ContextManager keeping the conversation
+                within a token budget. It runs before every LLM call, and the
+                shortened history is what the next turn builds on.
+
+        When a limit is reached while the model still asks for tools, the
+        agent makes one last LLM call without tools to get a final answer.
+        The limit is reported as `stop_reason` in the run metadata.
         """
         self.instructions = instructions
         self.tools = tools if tools else []
+        self.tool_registry: Dict[str, Tool] = {t.name: t for t in self.tools}
+        # Shared by all runs, so concurrent conversations cannot exhaust threads
+        self.tool_pool = ThreadPoolExecutor(max_workers=max_tool_workers, thread_name_prefix="agent-tool")
         self.model_name = model_name
         self.temperature = temperature
+        # Created once: the underlying client keeps its connections alive across turns
+        self.llm = LLM(
+            model=self.model_name,
+            temperature=self.temperature,
+            tools=self.tools
+        )
+        # Same model and tools but tool calls disabled, used to force a final
+        # answer. Keeping the tools keeps the prompt prefix cacheable.
+        self.final_llm = LLM(
+            model=self.model_name,
+            temperature=self.temperature,
+            tools=self.tools,
+            tool_choice="none"
+        )
+        self.max_iterations = max_iterations
+        self.max_tokens = max_tokens
+        self.max_time = max_time
+        self.context_manager = context_manager
         
         # Initialize memory and state machine
-        self.memory = ShortTermMemory()
+        # Runs are never mutated once complete, so memory can keep them by reference
+        self.memory = ShortTermMemory(deep_copy=False)
         self.workflow = self._create_state_machine()
 
     def _prepare_messages_step(self, state: AgentState) -> AgentState:
         """Step logic: Prepare messages for LLM consumption"""
-        messages = state.get("messages", [])
-        
-        # If no messages exist, start with system message
-        if not messages:
-            messages = [SystemMessage(content=state["instructions"])]
-            
-        # Add the new user message
-        messages.append(UserMessage(content=state["user_query"]))
+        history = state.get("messages", [])
+        # The system message is rebuilt from the instructions, history follows it
+        if history and history[0].role == "system":
+            history = history[1:]
+
+        # Stable parts first so the provider can reuse the cached prefix
+        # (a new list: snapshots share the old one)
+        messages = Prompt(
+            system=state["instructions"],
+            history=history,
+            query=state["user_query"],
+        ).to_messages()
         
         return {
             "messages": messages,
-            "session_id": state["session_id"]
+            "session_id": state["session_id"],
+            "iterations": 0,
+            "started_at": time.time(),
+            "stop_reason": None,
         }
 
-    def _llm_step(self, state: AgentState) -> AgentState:
-        """Step logic: Process the current state through the LLM"""
-        # Initialize LLM
-        llm = LLM(
-            model=self.model_name,
-            temperature=self.temperature,
-            tools=self.tools
-        )
+    def _context_step(self, state: AgentState) -> AgentState:
+        """Step logic: Fit the conversation into the context budget"""
+        messages = self.context_manager.apply(state["messages"])
+        if messages is state["messages"]:
+            return {}
+        return {"messages": messages}
 
-        response = llm.invoke(state["messages"])
-        tool_calls = response.tool_calls if response.tool_calls else None
+    @staticmethod
+    def _on_token(resource: Optional[Resource]):
+        return resource.vars.get("on_token") if resource else None
 
-        current_total = state.get("total_tokens", 0)
-        if response.token_usage:
-            current_total += response.token_usage.total_tokens
+    def _llm_step(self, state: AgentState, resource: Resource) -> AgentState:
+        """Step logic: Process the current state through the LLM"""
+        response = self.llm.invoke(state["messages"], on_token=self._on_token(resource))
+        tool_calls = response.tool_calls if response.tool_calls else None
 
         # Create AI message with content and tool calls
         ai_message = AIMessage(
@@ -81,35 +137,111 @@ class Agent:
             "messages": state["messages"] + [ai_message],
             "current_tool_calls": tool_calls,
             "session_id": state["session_id"],
+            **self._usage_updates(state, response),
+        }
+
+    @staticmethod
+    def _usage_updates(state: AgentState, response: AIMessage) -> AgentState:
+        """Add the tokens, cost and latency of an LLM response to the run totals"""
+        current_total = state.get("total_tokens", 0)
+        cached_total = state.get("cached_tokens", 0)
+        if response.token_usage:
+            current_total += response.token_usage.total_tokens
+            cached_total += response.token_usage.cached_tokens
+        return {
             "total_tokens": current_total,
+            "cached_tokens": cached_total,
+            "cost": state.get("cost", 0.0) + (response.cost or 0.0),
+            "llm_time": state.get("llm_time", 0.0) + (response.latency or 0.0),
         }
 
+    def _call_tool(self, call: ToolCall) -> ToolMessage:
+        """Execute a single tool call and wrap its result in a ToolMessage"""
+        function_name = call.function.name
+        tool = self.tool_registry.get(function_name)
+        if tool is None:
+            # The model still needs an answer for this tool call id
+            result = f"Error: unknown tool '{function_name}'"
+        else:
+            function_args = json.loads(call.function.arguments)
+            output = tool(**function_args)
+            if tool.is_async:
+                # Async calls always run on worker threads (see _tool_step),
+                # which have no event loop
+                output = asyncio.run(output)
+            result = str(output)
+
+        return ToolMessage(
+            content=json.dumps(result),
+            tool_call_id=call.id,
+            name=function_name,
+        )
+
     def _tool_step(self, state: AgentState) -> AgentState:
         """Step logic: Execute any pending tool calls"""
         tool_calls = state["current_tool_calls"] or []
-        tool_messages = []
-        
-        for call in tool_calls:
-            # Access tool call data correctly
-            function_name = call.function.name
-            function_args = json.loads(call.function.arguments)
-            tool_call_id = call.id
-            # Find the matching tool
-            tool = next((t for t in self.tools if t.name == function_name), None)
-            if tool:
-                result = str(tool(**function_args))
-                tool_message = ToolMessage(
-                    content=json.dumps(result), 
-                    tool_call_id=tool_call_id, 
-                    name=function_name, 
-                )
-                tool_messages.append(tool_message)
+        started = time.perf_counter()
+
+        # A single sync call runs inline. Async calls never do: the caller may
+        # already run an event loop (Jupyter), where asyncio.run would fail.
+        runs_async = any(
+            getattr(self.tool_registry.get(call.function.name), "is_async", False)
+            for call in tool_calls
+        )
+        if len(tool_calls) > 1 or runs_async:
+            # Independent calls run concurrently; map keeps the call order
+            tool_messages = list(self.tool_pool.map(self._call_tool, tool_calls))
+        else:
+            tool_messages = [self._call_tool(call) for call in tool_calls]
         
         # Clear tool calls and add results to messages
         return {
             "messages": state["messages"] + tool_messages,
             "current_tool_calls": None,
-            "session_id": state["session_id"]
+            "session_id": state["session_id"],
+            "iterations": state.get("iterations", 0) + 1,
+            "tool_time": state.get("tool_time", 0.0) + time.perf_counter() - started,
+        }
+
+    def _limit_reached(self, state: AgentState) -> Optional[str]:
+        """Return the name of the first exceeded limit, if any"""
+        if self.max_iterations is not None and state.get("iterations", 0) >= self.max_iterations:
+            return "max_iterations"
+        if self.max_tokens is not None and state.get("total_tokens", 0) >= self.max_tokens:
+            return "max_tokens"
+        if self.max_time is not None and time.time() - state.get("started_at", time.time()) >= self.max_time:
+            return "max_time"
+        return None
+
+    def _finalize_step(self, state: AgentState, resource: Resource) -> AgentState:
+        """Step logic: Answer without tools once a limit is reached"""
+        reason = self._limit_reached(state) or "limit"
+
+        # Every tool call needs an answer before the model can be called again
+        skipped = [
+            ToolMessage(
+                content=json.dumps(f"Not executed: {reason} reached"),
+                tool_call_id=call.id,
+                name=call.function.name,
+            )
+            for call in state["current_tool_calls"] or []
+        ]
+        messages = state["messages"] + skipped
+        # The instruction is for this call only; the history keeps just the answer
+        instruction = SystemMessage(content=(
+            "You cannot call any more tools. Give your final answer now, "
+            "using only the information gathered so far."
+        ))
+
+        # final_llm keeps the tool schemas but sets tool_choice="none", so the model has to answer
+        response = self.final_llm.invoke(messages + [instruction], on_token=self._on_token(resource))
+
+        return {
+            "messages": messages + [AIMessage(content=response.content)],
+            "current_tool_calls": None,
+            "session_id": state["session_id"],
+            **self._usage_updates(state, response),
+            "stop_reason": reason,
         }
 
     def _create_state_machine(self) -> StateMachine[AgentState]:
@@ -121,39 +253,38 @@ class Agent:
         message_prep = Step[AgentState]("message_prep", self._prepare_messages_step)
         llm_processor = Step[AgentState]("llm_processor", self._llm_step)
         tool_executor = Step[AgentState]("tool_executor", self._tool_step)
+        finalizer = Step[AgentState]("finalizer", self._finalize_step)
         termination = Termination[AgentState]()
         
-        machine.add_steps([entry, message_prep, llm_processor, tool_executor, termination])
+        machine.add_steps([entry, message_prep, llm_processor, tool_executor, finalizer, termination])
         
         # Add transitions
         machine.connect(entry, message_prep)
-        machine.connect(message_prep, llm_processor)
+        # With a context manager, every LLM call goes through it first
+        llm_input = llm_processor
+        if self.context_manager is not None:
+            llm_input = Step[AgentState]("context_manager", self._context_step)
+            machine.add_steps([llm_input])
+            machine.connect(llm_input, llm_processor)
+        machine.connect(message_prep, llm_input)
         
         # Transition based on whether there are tool calls
         def check_tool_calls(state: AgentState) -> Union[Step[AgentState], str]:
             """Transition logic: Check if there are tool calls"""
             if state.get("current_tool_calls"):
+                if self._limit_reached(state):
+                    return finalizer
                 return tool_executor
             return termination
         
-        machine.connect(llm_processor, [tool_executor, termination], check_tool_calls)
-        machine.connect(tool_executor, llm_processor)  # Go back to llm after tool execution
+        machine.connect(llm_processor, [tool_executor, finalizer, termination], check_tool_calls)
+        machine.connect(tool_executor, llm_input)  # Go back to llm after tool execution
+        machine.connect(finalizer, termination)
         
         return machine
 
-    def invoke(self, query: str, session_id: Optional[str] = None) -> Run:
-        """
-        Run the agent on a query
-        
-        Args:
-            query: The user's query to process
-            session_id: Optional session identifier (uses "default" if None)
-            
-        Returns:
-            The final run object after processing
-        """
-        session_id = session_id or "default"
-
+    def _initial_state(self, query: str, session_id: str) -> AgentState:
+        """Build the initial state for a new run, continuing the session history"""
         # Create session if it doesn't exist
         self.memory.create_session(session_id)
 
@@ -165,7 +296,7 @@ class Agent:
             if last_state:
                 previous_messages = last_state["messages"]
 
-        initial_state: AgentState = {
+        return {
             "user_query": query,
             "instructions": self.instructions,
             "messages": previous_messages,
@@ -173,13 +304,72 @@ class Agent:
             "session_id": session_id,
         }
 
-        run_object = self.workflow.run(initial_state)
+    @staticmethod
+    def _record_stats(run: Run):
+        """Expose why the tool loop ended, token counts, cost and timings in the run metadata"""
+        final_state = run.get_final_state() or {}
+        run.stats["stop_reason"] = final_state.get("stop_reason") or "completed"
+        run.stats["total_tokens"] = final_state.get("total_tokens", 0)
+        run.stats["cached_tokens"] = final_state.get("cached_tokens", 0)
+        run.stats["cost"] = final_state.get("cost", 0.0)
+        run.stats["llm_time"] = final_state.get("llm_time", 0.0)
+        run.stats["tool_time"] = final_state.get("tool_time", 0.0)
+        # Everything else: state machine, memory, context management, ...
+        run.stats["overhead_time"] = max(
+            0.0, run.duration - run.stats["llm_time"] - run.stats["tool_time"]
+        )
+
+    def invoke(self, query: str, session_id: Optional[str] = None,
+               on_token: Optional[Callable[[str], None]] = None) -> Run:
+        """
+        Run the agent on a query
+        
+        Args:
+            query: The user's query to process
+            session_id: Optional session identifier (uses "default" if None)
+            on_token: Optional callback receiving the answer text as it is
+                generated. It is called from the thread running the step.
+            
+        Returns:
+            The final run object after processing
+        """
+        session_id = session_id or "default"
+        initial_state = self._initial_state(query, session_id)
+
+        run_object = self.workflow.run(initial_state, Resource(vars={"on_token": on_token}))
+        self._record_stats(run_object)
         
         # Store the complete run object in memory
         self.memory.add(run_object, session_id)
         
         return run_object
 
+    async def ainvoke(self, query: str, session_id: Optional[str] = None,
+                      on_token: Optional[Callable[[str], None]] = None) -> Run:
+        """
+        Async variant of `invoke`, for serving many conversations on one event loop
+        
+        Args:
+            query: The user's query to process
+            session_id: Optional session identifier (uses "default" if None)
+            on_token: Optional callback receiving the answer text as it is
+                generated. It is called from an executor thread, so use
+                `loop.call_soon_threadsafe` to hand tokens to the event loop.
+            
+        Returns:
+            The final run object after processing
+        """
+        session_id = session_id or "default"
+        initial_state = self._initial_state(query, session_id)
+
+        run_object = await self.workflow.arun(initial_state, Resource(vars={"on_token": on_token}))
+        self._record_stats(run_object)
+
+        # Store the complete run object in memory
+        self.memory.add(run_object, session_id)
+
+        return run_object
+
     def get_session_runs(self, session_id: Optional[str] = None) -> List[Run]:
         """Get all Run objects for a session
         
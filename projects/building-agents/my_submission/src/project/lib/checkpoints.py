@@ -0,0 +1,256 @@
+from typing import Any, Dict, List, Optional
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+
+
+@dataclass
+class CheckpointRecord:
+    """
+    Persisted form of a state machine Snapshot.
+
+    Only the fields changed by the step are stored, like the in-memory
+    snapshot; the full state is rebuilt by following `parent_id`.
+    """
+    run_id: str
+    seq: int
+    snapshot_id: str
+    parent_id: Optional[str]
+    step_id: str
+    branch: Optional[str]
+    timestamp: datetime
+    changes: Dict[str, Any]
+    # Fallback step the run continued with, if the step failed over
+    fallback: Optional[str] = None
+
+
+class CheckpointStore(ABC):
+    """Interface for durable storage of run snapshots"""
+
+    @abstractmethod
+    def save(self, records: List[CheckpointRecord]):
+        """Persist a batch of records"""
+        pass
+
+    @abstractmethod
+    def load(self, run_id: str) -> List[CheckpointRecord]:
+        """Load all records of a run, ordered by `seq`"""
+        pass
+
+    def flush(self):
+        """Block until every saved record is durable"""
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """
+    Store checkpoints in a SQLite database.
+
+    The database runs in WAL mode, and each `save` call is written in a
+    single transaction. State changes are pickled, so they may hold any
+    picklable object (messages, tool calls, ...).
+
+    Args:
+        path: Database file, created if missing
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                run_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                snapshot_id TEXT NOT NULL,
+                parent_id TEXT,
+                step_id TEXT NOT NULL,
+                branch TEXT,
+                timestamp TEXT NOT NULL,
+                changes BLOB NOT NULL,
+                fallback TEXT,
+                PRIMARY KEY (run_id, seq)
+            )
+            """
+        )
+        # Databases created before fallbacks were recorded lack the column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(checkpoints)")}
+        if "fallback" not in columns:
+            self._conn.execute("ALTER TABLE checkpoints ADD COLUMN fallback TEXT")
+        self._conn.commit()
+
+    def save(self, records: List[CheckpointRecord]):
+        rows = [
+            (r.run_id, r.seq, r.snapshot_id, r.parent_id, r.step_id, r.branch,
+             r.timestamp.isoformat(), pickle.dumps(r.changes), r.fallback)
+            for r in records
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(run_id, seq, snapshot_id, parent_id, step_id, branch, timestamp, changes, fallback) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def load(self, run_id: str) -> List[CheckpointRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id, seq, snapshot_id, parent_id, step_id, branch, timestamp, changes, fallback "
+                "FROM checkpoints WHERE run_id = ? ORDER BY seq",
+                (run_id,),
+            ).fetchall()
+        return [
+            CheckpointRecord(
+                run_id=row[0], seq=row[1], snapshot_id=row[2], parent_id=row[3],
+                step_id=row[4], branch=row[5],
+                timestamp=datetime.fromisoformat(row[6]),
+                changes=pickle.loads(row[7]),
+                fallback=row[8],
+            )
+            for row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FileCheckpointStore(CheckpointStore):
+    """
+    Store checkpoints as one append-only pickle file per run.
+
+    Args:
+        directory: Folder holding the `<run_id>.ckpt` files, created if missing
+        fsync: Force every batch to disk before `save` returns
+    """
+
+    def __init__(self, directory: str, fsync: bool = True):
+        self.directory = directory
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, run_id: str) -> str:
+        return os.path.join(self.directory, f"{run_id}.ckpt")
+
+    def save(self, records: List[CheckpointRecord]):
+        by_run: Dict[str, List[CheckpointRecord]] = {}
+        for record in records:
+            by_run.setdefault(record.run_id, []).append(record)
+
+        with self._lock:
+            for run_id, run_records in by_run.items():
+                with open(self._path(run_id), "ab") as f:
+                    for record in run_records:
+                        pickle.dump(record, f)
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+
+    def load(self, run_id: str) -> List[CheckpointRecord]:
+        path = self._path(run_id)
+        if not os.path.exists(path):
+            return []
+
+        records = []
+        with self._lock, open(path, "rb") as f:
+            while True:
+                try:
+                    records.append(pickle.load(f))
+                except EOFError:
+                    break
+                except pickle.UnpicklingError:
+                    # A crash mid-write leaves a truncated last record
+                    break
+        return sorted(records, key=lambda r: r.seq)
+
+
+class WriteBehindCheckpointStore(CheckpointStore):
+    """
+    Batch writes to another store on a background thread.
+
+    `save` only enqueues records, so steps do not wait for the disk. At most
+    `max_pending` records are queued; when the queue is full `save` blocks,
+    which bounds both memory and how much progress a crash can lose.
+
+    Args:
+        store: The store that records are eventually written to
+        max_pending: Maximum number of records waiting to be written
+        batch_size: Maximum number of records written per batch
+
+    Example:
+        >>> store = WriteBehindCheckpointStore(SQLiteCheckpointStore("runs.db"))
+        >>> machine = StateMachine[AgentState](AgentState, checkpoints=store)
+    """
+
+    def __init__(self, store: CheckpointStore, max_pending: int = 1000, batch_size: int = 100):
+        self.store = store
+        self.batch_size = batch_size
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._error: Optional[BaseException] = None
+        self._worker = threading.Thread(target=self._drain, daemon=True)
+        self._worker.start()
+
+    def _drain(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                self._queue.task_done()
+                return
+
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    # Put the stop marker back so the loop exits after this batch
+                    self._queue.task_done()
+                    self._queue.put(None)
+                    break
+                batch.append(record)
+
+            try:
+                self.store.save(batch)
+            except BaseException as e:
+                self._error = e
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _raise_pending_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def save(self, records: List[CheckpointRecord]):
+        self._raise_pending_error()
+        for record in records:
+            self._queue.put(record)
+
+    def load(self, run_id: str) -> List[CheckpointRecord]:
+        self.flush()
+        return self.store.load(run_id)
+
+    def flush(self):
+        self._queue.join()
+        self.store.flush()
+        self._raise_pending_error()
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+        self.store.close()
+        self._raise_pending_error()
@@ -0,0 +1,216 @@
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+import re
+
+from lib.context import Tokenizer, default_tokenizer
+from lib.documents import Document
+
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\s+")
+
+# Finer separators tried when a unit is still over the token limit
+_LEVELS = {
+    "paragraph": [_PARAGRAPH, _SENTENCE, _WORD],
+    "sentence": [_SENTENCE, _WORD],
+    "token": [_WORD],
+}
+
+
+class _Span(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+
+
+class _Piece(NamedTuple):
+    """A chunk being assembled, possibly spanning the end of one page and the start of the next"""
+    content: str
+    tokens: int
+    source: Document
+    page: Any
+    start: int
+    page_end: Any
+    end: int
+
+
+class Chunker:
+    """
+    Split documents into chunks of bounded token size.
+
+    Text is cut at paragraph, sentence or word boundaries depending on the
+    strategy; a unit still over `max_tokens` is split at the next finer
+    boundary. Units are packed greedily into chunks of at most `max_tokens`,
+    and each chunk repeats the end of the previous one, up to `overlap`
+    tokens cut at sentence or word boundaries, so a passage cut in two is
+    still found whole.
+
+    A last chunk under `min_tokens` is merged into the first chunk of the
+    next document of the same source, so short pages do not each cost a
+    vector.
+
+    Chunks carry their position in metadata: `source`, `page` and `start`
+    (character offset in that page), `page_end` and `end` (offset in that
+    page), and `chunk`, their rank within the source. Their ids are derived
+    from the same position, so re-loading a file upserts the same chunks.
+
+    Args:
+        strategy: "paragraph", "sentence" or "token"
+        max_tokens: Maximum tokens per chunk
+        overlap: Maximum tokens repeated from the previous chunk
+        min_tokens: Chunks below this are merged across pages when possible
+        tokenizer: Counts tokens; tiktoken when installed, else an estimate
+
+    Example:
+        >>> chunker = Chunker(strategy="sentence", max_tokens=256, overlap=32)
+        >>> chunks = list(chunker.chunk(PDFLoader("report.pdf").lazy_load()))
+        >>> chunks[0].metadata
+        {'source': 'report.pdf', 'page': 1, 'start': 0, 'page_end': 1, 'end': 1043, 'chunk': 0}
+    """
+
+    def __init__(self, strategy: str = "paragraph", max_tokens: int = 512,
+                 overlap: int = 64, min_tokens: int = 32,
+                 tokenizer: Optional[Tokenizer] = None):
+        if strategy not in _LEVELS:
+            raise ValueError(f"Invalid strategy '{strategy}'. Expected 'paragraph', 'sentence' or 'token'.")
+        if overlap >= max_tokens:
+            raise ValueError("overlap must be smaller than max_tokens.")
+        self.strategy = strategy
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.min_tokens = min_tokens
+        self._count_tokens = tokenizer or default_tokenizer()
+
+    def _segments(self, text: str, separator: re.Pattern, start: int, end: int) -> List[_Span]:
+        """Non-blank pieces of text[start:end] between separators, whitespace trimmed"""
+        bounds, position = [], start
+        for match in separator.finditer(text, start, end):
+            bounds.append((position, match.start()))
+            position = match.end()
+        bounds.append((position, end))
+
+        spans = []
+        for s, e in bounds:
+            piece = text[s:e]
+            stripped = piece.strip()
+            if stripped:
+                s += len(piece) - len(piece.lstrip())
+                e = s + len(stripped)
+                spans.append(_Span(s, e, self._count_tokens(stripped)))
+        return spans
+
+    def _units(self, text: str, start: int, end: int, levels: List[re.Pattern]) -> List[_Span]:
+        units = []
+        for span in self._segments(text, levels[0], start, end):
+            if span.tokens > self.max_tokens and len(levels) > 1:
+                units += self._units(text, span.start, span.end, levels[1:])
+            else:
+                units.append(span)
+        return units
+
+    def _tail(self, text: str, units: List[_Span], budget: int,
+              separators: Sequence[re.Pattern] = (_SENTENCE, _WORD)) -> List[_Span]:
+        """Last units fitting in `budget` tokens, cutting the first that does not fit at finer boundaries"""
+        carried: List[_Span] = []
+        total = 0
+        for unit in reversed(units):
+            if total + unit.tokens <= budget:
+                carried.insert(0, unit)
+                total += unit.tokens
+                continue
+            for i, separator in enumerate(separators):
+                pieces = self._segments(text, separator, unit.start, unit.end)
+                if len(pieces) > 1:
+                    carried = self._tail(text, pieces, budget - total, separators[i:]) + carried
+                    break
+            break
+        return carried
+
+    def split(self, text: str) -> List[_Span]:
+        """Spans (start, end, tokens) of the chunks of a text"""
+        chunks: List[List[_Span]] = []
+        current: List[_Span] = []
+        for unit in self._units(text, 0, len(text), _LEVELS[self.strategy]):
+            if current and sum(u.tokens for u in current) + unit.tokens > self.max_tokens:
+                chunks.append(current)
+                # Start the next chunk with the tail of this one
+                current = self._tail(text, current, min(self.overlap, self.max_tokens - unit.tokens))
+            current.append(unit)
+        if current:
+            chunks.append(current)
+
+        return [
+            _Span(units[0].start, units[-1].end, self._count_tokens(text[units[0].start:units[-1].end]))
+            for units in chunks
+        ]
+
+    @staticmethod
+    def _source(document: Document) -> str:
+        return str((document.metadata or {}).get("source", ""))
+
+    @staticmethod
+    def _page(document: Document) -> Any:
+        return (document.metadata or {}).get("page", document.id)
+
+    def _document(self, piece: _Piece, rank: int) -> Document:
+        source = self._source(piece.source)
+        metadata: Dict[str, Any] = {
+            **(piece.source.metadata or {}),
+            "source": source,
+            "page": piece.page,
+            "start": piece.start,
+            "page_end": piece.page_end,
+            "end": piece.end,
+            "chunk": rank,
+        }
+        return Document(
+            id=f"{source}:{piece.page}:{piece.start}",
+            content=piece.content,
+            metadata=metadata,
+        )
+
+    def chunk(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Chunk a stream of documents, such as the pages of a PDF in order.
+
+        Documents are consumed one at a time and chunks are yielded as soon
+        as they are complete.
+        """
+        pending: Optional[_Piece] = None
+        ranks: Dict[str, int] = {}
+
+        def emit(piece: _Piece) -> Document:
+            source = self._source(piece.source)
+            rank = ranks.get(source, 0)
+            ranks[source] = rank + 1
+            return self._document(piece, rank)
+
+        for document in documents:
+            text = document.content or ""
+            page = self._page(document)
+            spans = self.split(text)
+            if pending is not None and (not spans or self._source(pending.source) != self._source(document)):
+                yield emit(pending)
+                pending = None
+
+            for i, span in enumerate(spans):
+                piece = _Piece(text[span.start:span.end], span.tokens, document,
+                               page, span.start, page, span.end)
+                if pending is not None:
+                    if pending.tokens + piece.tokens <= self.max_tokens:
+                        piece = pending._replace(
+                            content=f"{pending.content}\n{piece.content}",
+                            tokens=pending.tokens + piece.tokens,
+                            page_end=page,
+                            end=span.end,
+                        )
+                    else:
+                        yield emit(pending)
+                    pending = None
+                if i == len(spans) - 1 and piece.tokens < self.min_tokens:
+                    pending = piece
+                else:
+                    yield emit(piece)
+
+        if pending is not None:
+            yield emit(pending)
@@ -0,0 +1,197 @@
+from typing import Callable, List, Optional
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from lib.llm import LLM
+from lib.messages import BaseMessage, SystemMessage, ToolMessage, UserMessage
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to an estimate
+    tiktoken = None
+
+
+Tokenizer = Callable[[str], int]
+
+# Tokens added by the chat format around every message
+MESSAGE_OVERHEAD = 4
+
+
+def default_tokenizer(model: str = "gpt-4o-mini") -> Tokenizer:
+    """Count tokens with tiktoken when installed, else estimate 4 characters per token"""
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(encoding.encode(text))
+    return lambda text: (len(text) + 3) // 4
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group a conversation into turns, each starting at a user message.
+
+    Messages before the first user message (usually the system message)
+    form their own leading group. Tool results stay in the turn of the
+    assistant message that requested them.
+    """
+    turns: List[List[BaseMessage]] = [[]]
+    for message in messages:
+        if isinstance(message, UserMessage) and turns[-1]:
+            turns.append([])
+        turns[-1].append(message)
+    return [turn for turn in turns if turn]
+
+
+class ContextPolicy(ABC):
+    """A way of shrinking the conversation sent to the model"""
+
+    @abstractmethod
+    def apply(self, messages: List[BaseMessage], manager: 'ContextManager') -> List[BaseMessage]:
+        """Return a shorter conversation; the leading system message must be kept"""
+        pass
+
+
+class DropToolPayloads(ContextPolicy):
+    """
+    Replace the content of tool results older than the last turns.
+
+    The tool messages themselves are kept, since every tool call of an
+    assistant message needs an answer.
+
+    Args:
+        keep_last_turns: Recent turns whose tool results are left intact
+        placeholder: Content put in place of older tool results
+    """
+    def __init__(self, keep_last_turns: int = 1, placeholder: str = "[tool output removed]"):
+        self.keep_last_turns = keep_last_turns
+        self.placeholder = placeholder
+
+    def apply(self, messages, manager):
+        head, turns = manager.partition(messages)
+        cutoff = max(0, len(turns) - self.keep_last_turns)
+        result = list(head)
+        for i, turn in enumerate(turns):
+            for message in turn:
+                if i < cutoff and isinstance(message, ToolMessage) and message.content != self.placeholder:
+                    message = message.model_copy(update={"content": self.placeholder})
+                result.append(message)
+        return result
+
+
+class KeepLastTurns(ContextPolicy):
+    """
+    Drop all but the last turns of the conversation.
+
+    Args:
+        turns: Number of recent turns to keep
+    """
+    def __init__(self, turns: int = 10):
+        self.turns = turns
+
+    def apply(self, messages, manager):
+        head, turns = manager.partition(messages)
+        kept = turns[-self.turns:] if self.turns > 0 else []
+        return head + [message for turn in kept for message in turn]
+
+
+class SummarizeOldTurns(ContextPolicy):
+    """
+    Roll turns older than the last ones into a single summary message.
+
+    The summary is a system message placed right after the instructions,
+    and is itself folded into the next summary.
+
+    Args:
+        llm: Model writing the summary (a small, cheap model is enough)
+        keep_last_turns: Recent turns kept verbatim
+    """
+    PROMPT = (
+        "Summarize the conversation below for an assistant that will continue it. "
+        "Keep facts, names, numbers and open questions; drop small talk.\n\n{transcript}"
+    )
+    PREFIX = "Summary of the earlier conversation:\n"
+
+    def __init__(self, llm: LLM, keep_last_turns: int = 4):
+        self.llm = llm
+        self.keep_last_turns = keep_last_turns
+
+    def apply(self, messages, manager):
+        head, turns = manager.partition(messages)
+        if len(turns) <= self.keep_last_turns:
+            return messages
+        cutoff = len(turns) - self.keep_last_turns
+        old = [message for turn in turns[:cutoff] for message in turn]
+
+        # A previous summary sits in the head, after the instructions
+        instructions = [m for m in head if not self._is_summary(m)]
+        previous = [m for m in head if self._is_summary(m)]
+
+        transcript = "\n".join(
+            f"{message.role}: {message.content}" for message in previous + old if message.content
+        )
+        summary = self.llm.invoke(self.PROMPT.format(transcript=transcript)).content or ""
+        recent = [message for turn in turns[cutoff:] for message in turn]
+        return instructions + [SystemMessage(content=self.PREFIX + summary)] + recent
+
+    def _is_summary(self, message: BaseMessage) -> bool:
+        return isinstance(message, SystemMessage) and (message.content or "").startswith(self.PREFIX)
+
+
+class ContextManager:
+    """
+    Keep the conversation sent to the model within a token budget.
+
+    Policies are applied in order, and only while the conversation is over
+    `max_tokens`, so short conversations are sent untouched. Messages before
+    the first user message (the system instructions) are always kept.
+
+    Args:
+        policies: Policies tried in order until the conversation fits
+        max_tokens: Token budget of the conversation (None to always apply
+            every policy)
+        tokenizer: Function counting the tokens of a string; defaults to
+            tiktoken when installed, else an estimate
+
+    Example:
+        >>> manager = ContextManager(
+        ...     policies=[DropToolPayloads(), SummarizeOldTurns(LLM()), KeepLastTurns(10)],
+        ...     max_tokens=8000,
+        ... )
+        >>> agent = Agent(model_name="gpt-4o-mini", instructions=..., context_manager=manager)
+    """
+    def __init__(self,
+                 policies: List[ContextPolicy],
+                 max_tokens: Optional[int] = None,
+                 tokenizer: Optional[Tokenizer] = None):
+        self.policies = policies
+        self.max_tokens = max_tokens
+        # Messages are re-counted every turn, so remember counts per text
+        self._count_text = lru_cache(maxsize=4096)(tokenizer or default_tokenizer())
+
+    def count_message(self, message: BaseMessage) -> int:
+        tokens = MESSAGE_OVERHEAD + self._count_text(message.content or "")
+        for call in getattr(message, "tool_calls", None) or []:
+            tokens += self._count_text(call.function.name) + self._count_text(call.function.arguments)
+        return tokens
+
+    def count_tokens(self, messages: List[BaseMessage]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+    def partition(self, messages: List[BaseMessage]):
+        """Split messages into the pinned head and the list of turns"""
+        groups = split_turns(messages)
+        if groups and not isinstance(groups[0][0], UserMessage):
+            return groups[0], groups[1:]
+        return [], groups
+
+    def fits(self, messages: List[BaseMessage]) -> bool:
+        return self.max_tokens is not None and self.count_tokens(messages) <= self.max_tokens
+
+    def apply(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Return the conversation to send, shortened if it exceeds the budget"""
+        for policy in self.policies:
+            if self.fits(messages):
+                break
+            messages = policy.apply(messages, self)
+        return messages
@@ -0,0 +1,233 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+try:
+    import onnxruntime
+    from tokenizers import Tokenizer as HFTokenizer
+except ImportError:  # optional: only needed by OnnxEmbeddingFunction
+    onnxruntime = None
+    HFTokenizer = None
+
+
+def content_hash(model: str, text: str) -> str:
+    """Key of an embedding: the same text embedded by another model is another entry"""
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk store of embeddings keyed by a hash of the model and the text.
+
+    Vectors are stored as float32 blobs in SQLite, so a cache of 100k
+    1536-dimensional embeddings takes about 600 MB.
+
+    Args:
+        path: SQLite database file, created if missing
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # Stay under SQLite's limit on query parameters
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Embedding function that only sends texts it has not embedded before.
+
+    Wraps another embedding function (typically OpenAIEmbeddingFunction).
+    Texts found in the cache are not sent; the others are embedded in one
+    call and added to the cache. Duplicate texts within a call are embedded
+    once.
+
+    Args:
+        embedding_function: Function computing embeddings on a cache miss
+        cache: Where embeddings are stored
+        model: Name included in the cache key; defaults to the wrapped
+            function's `model_name`
+
+    Example:
+        >>> openai_ef = embedding_functions.OpenAIEmbeddingFunction(api_key=key)
+        >>> ef = CachedEmbeddingFunction(openai_ef, EmbeddingCache("embeddings.sqlite"))
+    """
+
+    def __init__(self, embedding_function: EmbeddingFunction,
+                 cache: EmbeddingCache, model: Optional[str] = None):
+        self.embedding_function = embedding_function
+        self.cache = cache
+        self.model = model or getattr(embedding_function, "model_name", type(embedding_function).__name__)
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys = [content_hash(self.model, text) for text in input]
+        found = self.cache.get_many(list(set(keys)))
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, input):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(keys) - sum(1 for key in keys if key in missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.embedding_function(list(missing.values()))
+            computed = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing.keys(), vectors)
+            }
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length, so dot products are cosine similarities"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class HashingEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Local, dependency-free embeddings from hashed character n-grams.
+
+    Every n-gram of the lowercased text is hashed into one of `dimensions`
+    buckets with a random sign, and the counts are normalized. Texts sharing
+    words and word pieces get close vectors, which is enough for keyword-like
+    retrieval with no model, no network and no cost. It does not capture
+    meaning like a trained model; use it for tests, offline work, or as a
+    fallback.
+
+    Args:
+        dimensions: Length of the vectors
+        ngram_range: Smallest and largest n-gram lengths
+
+    Example:
+        >>> store = manager.get_or_create_store("games_local", embedding_function=HashingEmbeddingFunction())
+    """
+
+    def __init__(self, dimensions: int = 1024, ngram_range: Tuple[int, int] = (3, 5)):
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+        self.model_name = f"hashing-{dimensions}-{ngram_range[0]}-{ngram_range[1]}"
+
+    def _ngram_hashes(self, text: str) -> List[int]:
+        text = f" {' '.join(text.lower().split())} ".encode("utf-8")
+        low, high = self.ngram_range
+        return [
+            zlib.crc32(text[i:i + n])
+            for n in range(low, high + 1)
+            for i in range(len(text) - n + 1)
+        ]
+
+    def __call__(self, input: Documents) -> Embeddings:
+        rows, hashes = [], []
+        for row, text in enumerate(input):
+            text_hashes = self._ngram_hashes(text)
+            rows += [row] * len(text_hashes)
+            hashes += text_hashes
+
+        # Fill the whole batch with one scatter-add
+        hashes = np.asarray(hashes, dtype=np.uint32)
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        matrix = np.zeros((len(input), self.dimensions), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), hashes % self.dimensions), signs)
+        return list(normalize_rows(matrix))
+
+
+class OnnxEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Local embeddings from a sentence-transformer model exported to ONNX.
+
+    The model folder must hold `model.onnx` and the Hugging Face
+    `tokenizer.json`, as exported by `optimum` (for example
+    sentence-transformers/all-MiniLM-L6-v2). Token vectors are mean-pooled
+    over the attention mask and normalized. Runs on the CPU and requires
+    `onnxruntime` and `tokenizers`.
+
+    Args:
+        model_dir: Folder holding the model and its tokenizer
+        max_length: Tokens kept per text; longer texts are truncated
+        batch_size: Texts per forward pass
+        providers: onnxruntime execution providers
+
+    Example:
+        >>> ef = OnnxEmbeddingFunction("models/all-MiniLM-L6-v2")
+        >>> store = manager.get_or_create_store("games_minilm", embedding_function=ef)
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 256, batch_size: int = 32,
+                 providers: Sequence[str] = ("CPUExecutionProvider",)):
+        if onnxruntime is None:
+            raise ImportError("OnnxEmbeddingFunction requires `pip install onnxruntime tokenizers`")
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), providers=list(providers)
+        )
+        self.tokenizer = HFTokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+        self.model_name = f"onnx-{os.path.basename(os.path.normpath(model_dir))}"
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, feeds)[0]  # (batch, tokens, dimensions)
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return normalize_rows(pooled.astype(np.float32))
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if not input:
+            return []
+        batches = [
+            self._embed_batch(list(input[start:start + self.batch_size]))
+            for start in range(0, len(input), self.batch_size)
+        ]
+        return list(np.vstack(batches))
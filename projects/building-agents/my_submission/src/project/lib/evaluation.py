@@ -4,9 +4,14 @@ from pydantic import BaseModel, Field
 
 from lib.agents import AgentState
 from lib.state_machine import Run
-from lib.llm import LLM
+from lib.llm import LLM, BatchResult
 from lib.messages import AIMessage, BaseMessage
 from lib.parsers import PydanticOutputParser
+from lib.pricing import get_price
+
+
+# Steps of an agent run that are bookkeeping rather than work toward the task
+_UNCOUNTED_STEPS = {"__entry__", "__termination__", "context_manager"}
 
 
 class TaskCompletionMetrics(BaseModel):
@@ -67,16 +72,8 @@ class AgentEvaluator:
     def __init__(self):
         self.llm_judge = LLM(model="gpt-4o-mini")
     
-    def evaluate_final_response(self, 
-                          test_case: TestCase, 
-                          agent_response: str,
-                          execution_time: float,
-                          total_tokens: int) -> EvaluationResult:
-        """
-        Evaluate the final response from the agent (black box approach)
-        """
-        # Use LLM as judge to evaluate the response
-        judge_prompt = f"""
+    def _judge_prompt(self, test_case: TestCase, agent_response: str) -> str:
+        return f"""
         Evaluate this agent response for the given task:
         
         Task: {test_case.description}
@@ -91,20 +88,76 @@ class AgentEvaluator:
         
         Provide your evaluation with a brief explanation.
         """
-        
-        # Use structured output with Pydantic model
+
+    def evaluate_final_response(self, 
+                          test_case: TestCase, 
+                          agent_response: str,
+                          execution_time: float,
+                          total_tokens: int) -> EvaluationResult:
+        """
+        Evaluate the final response from the agent (black box approach)
+        """
+        # Use LLM as judge to evaluate the response, with structured output
         judge_response = self.llm_judge.invoke(
-            input=judge_prompt, 
+            input=self._judge_prompt(test_case, agent_response), 
             response_format=JudgeEvaluation
         )
-        
+        return self._score_final_response(test_case, agent_response, execution_time,
+                                          total_tokens, judge_response)
+
+    def evaluate_final_responses(self,
+                                 test_cases: List[TestCase],
+                                 agent_responses: List[str],
+                                 execution_times: List[float],
+                                 total_tokens: List[int],
+                                 max_concurrency: int = 8,
+                                 rate_limit: Optional[float] = None) -> List[EvaluationResult]:
+        """
+        Evaluate many final responses, sending the judge prompts concurrently
+
+        Args:
+            test_cases: Test cases, aligned with the other lists
+            agent_responses: Final answer of the agent for each test case
+            execution_times: Execution time of each run in seconds
+            total_tokens: Tokens used by each run
+            max_concurrency: Maximum judge requests in flight
+            rate_limit: Maximum judge requests started per second
+
+        Returns:
+            One EvaluationResult per test case, in order. A judge request that
+            failed falls back to the same heuristics as a parsing error.
+        """
+        results: List[BatchResult] = self.llm_judge.batch(
+            [self._judge_prompt(tc, response) for tc, response in zip(test_cases, agent_responses)],
+            response_format=JudgeEvaluation,
+            max_concurrency=max_concurrency,
+            rate_limit=rate_limit,
+        )
+        return [
+            self._score_final_response(test_cases[r.index], agent_responses[r.index],
+                                       execution_times[r.index], total_tokens[r.index],
+                                       r.message, r.error)
+            for r in results
+        ]
+
+    def _score_final_response(self,
+                              test_case: TestCase,
+                              agent_response: str,
+                              execution_time: float,
+                              total_tokens: int,
+                              judge_response: Optional[AIMessage],
+                              judge_error: Optional[BaseException] = None) -> EvaluationResult:
+        """Turn the judge's answer into an EvaluationResult"""
         # Parse the structured response
         parser = PydanticOutputParser(model_class=JudgeEvaluation)
         try:
+            if judge_error is not None:
+                raise judge_error
             evaluation = parser.parse(judge_response)
         except Exception as e:
             print(f"Debug: Structured parsing error: {e}")
-            print(f"Debug: Judge response content: {judge_response.content}")
+            if judge_response is not None:
+                print(f"Debug: Judge response content: {judge_response.content}")
             
             # Fallback evaluation based on simple heuristics
             has_game_info = any(keyword in agent_response.lower() 
@@ -252,7 +305,7 @@ class AgentEvaluator:
         # Analyze the trajectory
         actual_steps = [
             snapshot for snapshot in run.snapshots 
-            if snapshot.step_id not in ["__entry__", "__termination__"]
+            if snapshot.step_id not in _UNCOUNTED_STEPS
         ]
         steps_taken = len(actual_steps)
         messages = final_state.get("messages", [])
@@ -296,11 +349,14 @@ class AgentEvaluator:
         if run.end_timestamp and run.start_timestamp:
             execution_time = (run.end_timestamp - run.start_timestamp).total_seconds()
         
+        # Agent runs record their real cost; older runs fall back to an estimate
+        cost = run.metadata.get("cost")
+        tool_time = run.metadata.get("tool_time", execution_time)
         system_metrics = SystemMetrics(
             total_tokens=total_tokens,
             execution_time=execution_time,
-            tool_call_latency=execution_time / max(len(tool_calls_made), 1),
-            cost_estimate=self._estimate_cost(total_tokens)
+            tool_call_latency=tool_time / max(len(tool_calls_made), 1),
+            cost_estimate=cost if cost is not None else self._estimate_cost(total_tokens)
         )
         
         # Calculate overall score
@@ -323,12 +379,11 @@ class AgentEvaluator:
             feedback=feedback
         )
     
-    def _estimate_cost(self, total_tokens: int) -> float:
-        """Estimate cost based on token usage (rough estimate for GPT-4o-mini)"""
-        # Rough estimate: $0.15 per 1M input tokens, $0.60 per 1M output tokens
-        # Assuming 50/50 split for simplicity
-        cost_per_token = (0.15 + 0.60) / 2 / 1_000_000
-        return total_tokens * cost_per_token
+    def _estimate_cost(self, total_tokens: int, model: str = "gpt-4o-mini") -> float:
+        """Estimate cost from a total token count, when the prompt/completion split is unknown"""
+        # Assuming a 50/50 split between prompt and completion tokens
+        price = get_price(model)
+        return total_tokens * price.blended / 1_000_000 if price else 0.0
     
     def _create_failed_evaluation(self, reason: str) -> EvaluationResult:
         """Create a failed evaluation result"""
@@ -1,14 +1,163 @@
-from typing import List, Optional, Dict, Any
+from typing import Callable, Iterator, List, Optional, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
+import os
+import random
+import threading
+import time
 from lib.messages import (
     AnyMessage,
     TokenUsage,
     AIMessage,
+    AIMessageChunk,
     BaseMessage,
+    SystemMessage,
+    ToolCallChunk,
     UserMessage,
 )
-from lib.tooling import Tool
+from lib.tooling import Tool, ToolCall
+from lib.llm_cache import LLMCache
+from lib.pricing import estimate_cost
+
+
+_clients: Dict[Tuple[Optional[str], Optional[str]], OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> OpenAI:
+    """
+    Return the shared OpenAI client for a given key and endpoint.
+
+    Clients are thread-safe and keep their HTTP connections alive, so reusing
+    one avoids a new connection pool (and TLS handshake) per LLM instance.
+
+    Args:
+        api_key: API key, or None to use OPENAI_API_KEY
+        base_url: Endpoint, or None to use OPENAI_API_BASE (Vocareum) or the default
+    """
+    base_url = base_url or os.getenv("OPENAI_API_BASE")
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                kwargs = {}
+                if api_key:
+                    kwargs["api_key"] = api_key
+                if base_url:
+                    kwargs["base_url"] = base_url
+                client = _clients[key] = OpenAI(**kwargs)
+    return client
+
+
+@dataclass
+class Prompt:
+    """
+    Messages of a request, grouped by how often they change.
+
+    Providers cache the longest previously seen prompt prefix, so the
+    messages are laid out from most to least stable: the static system
+    instructions, then the append-only conversation history, then a single
+    user message holding this request's context and question. Tool schemas
+    are sent by the LLM itself and are identical across requests.
+
+    Example:
+        >>> messages = Prompt(
+        ...     system="Answer from the context. Say you don't know otherwise.",
+        ...     context="\n\n".join(documents),
+        ...     query=question,
+        ... ).to_messages()
+    """
+    system: str
+    history: List[BaseMessage] = field(default_factory=list)
+    context: Optional[str] = None
+    query: Optional[str] = None
+
+    def to_messages(self) -> List[BaseMessage]:
+        messages: List[BaseMessage] = [SystemMessage(content=self.system)]
+        messages += self.history
+        if self.context is None:
+            if self.query is not None:
+                messages.append(UserMessage(content=self.query))
+            return messages
+
+        sections = [f"# Context:\n{self.context}"]
+        if self.query is not None:
+            sections.append(f"# Question:\n{self.query}")
+        messages.append(UserMessage(content="\n\n".join(sections)))
+        return messages
+
+
+def _token_usage(usage: Any) -> Optional[TokenUsage]:
+    """Convert the usage reported by the API, including prompt cache hits"""
+    if not usage:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return TokenUsage(
+        prompt_tokens=usage.prompt_tokens,
+        completion_tokens=usage.completion_tokens,
+        total_tokens=usage.total_tokens,
+        cached_tokens=(getattr(details, "cached_tokens", None) or 0) if details else 0,
+    )
+
+
+class RateLimiter:
+    """
+    Token bucket limiting how many requests start per second.
+
+    Up to `burst` requests may start at once; after that, one request can
+    start every 1/rate seconds. Thread-safe.
+
+    Args:
+        rate: Requests per second
+        burst: Bucket size (default: max(1, rate))
+    """
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may start"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one input of `LLM.batch`: either a message or the error it raised"""
+    index: int
+    message: Optional[AIMessage] = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _retry_after(error: RateLimitError) -> Optional[float]:
+    """Delay requested by the server in a 429 response, if any"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
 
 
 class LLM:
@@ -17,25 +166,37 @@ class LLM:
         model: str = "gpt-4o-mini",
         temperature: float = 0.0,
         tools: Optional[List[Tool]] = None,
-        api_key: Optional[str] = None
+        api_key: Optional[str] = None,
+        client: Optional[OpenAI] = None,
+        cache: Optional[LLMCache] = None,
+        tool_choice: str = "auto"
     ):
         self.model = model
         self.temperature = temperature
+        # "none" keeps the tool schemas in the prompt (and its cached prefix)
+        # while preventing the model from calling them
+        self.tool_choice = tool_choice
+        # Optional response cache, see lib.llm_cache
+        self.cache = cache
         
-        # Handle Vocareum configuration
-        import os
-        base_url = os.getenv("OPENAI_API_BASE")
-        if api_key:
-            self.client = OpenAI(api_key=api_key, base_url=base_url) if base_url else OpenAI(api_key=api_key)
-        else:
-            self.client = OpenAI(base_url=base_url) if base_url else OpenAI()
+        # Share one client (and its connections) per key and endpoint
+        self.client = client or get_client(api_key)
             
         self.tools: Dict[str, Tool] = {
             tool.name: tool for tool in (tools or [])
         }
+        # Serialized tool schemas, rebuilt only when a tool is registered
+        self._tool_schemas: Optional[List[Dict[str, Any]]] = None
 
     def register_tool(self, tool: Tool):
         self.tools[tool.name] = tool
+        self._tool_schemas = None
+
+    @property
+    def tool_schemas(self) -> List[Dict[str, Any]]:
+        if self._tool_schemas is None:
+            self._tool_schemas = [tool.dict() for tool in self.tools.values()]
+        return self._tool_schemas
 
     def _build_payload(self, messages: List[BaseMessage]) -> Dict[str, Any]:
         payload = {
@@ -45,8 +206,8 @@ class LLM:
         }
 
         if self.tools:
-            payload["tools"] = [tool.dict() for tool in self.tools.values()]
-            payload["tool_choice"] = "auto"
+            payload["tools"] = self.tool_schemas
+            payload["tool_choice"] = self.tool_choice
 
         return payload
 
@@ -60,29 +221,183 @@ class LLM:
         else:
             raise ValueError(f"Invalid input type {type(input)}.")
 
+    def stream(self, input: str | BaseMessage | List[BaseMessage]) -> Iterator[AIMessageChunk]:
+        """
+        Yield the response as it is generated.
+
+        Each chunk holds a content delta and/or tool call fragments. The last
+        chunk carries the token usage of the whole response.
+
+        Example:
+            >>> for chunk in llm.stream("Tell me about Pokemon"):
+            ...     print(chunk.content, end="", flush=True)
+        """
+        messages = self._convert_input(input)
+        yield from self._stream(self._build_payload(messages))
+
+    def _stream(self, payload: Dict[str, Any]) -> Iterator[AIMessageChunk]:
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        for event in self.client.chat.completions.create(**payload):
+            token_usage = _token_usage(event.usage)
+            if not event.choices:
+                # The usage event comes last, without choices
+                if token_usage:
+                    yield AIMessageChunk(token_usage=token_usage)
+                continue
+
+            delta = event.choices[0].delta
+            tool_calls = [
+                ToolCallChunk(
+                    index=call.index,
+                    id=call.id,
+                    name=call.function.name if call.function else None,
+                    arguments=(call.function.arguments or "") if call.function else "",
+                )
+                for call in delta.tool_calls or []
+            ]
+            if delta.content or tool_calls or token_usage:
+                yield AIMessageChunk(
+                    content=delta.content or "",
+                    tool_calls=tool_calls,
+                    token_usage=token_usage,
+                )
+
+    def _collect(self, chunks: Iterator[AIMessageChunk],
+                 on_token: Optional[Callable[[str], None]] = None) -> AIMessage:
+        """Assemble streamed chunks into a single AIMessage"""
+        content: List[str] = []
+        calls: Dict[int, Dict[str, Any]] = {}
+        token_usage = None
+
+        for chunk in chunks:
+            if chunk.content:
+                content.append(chunk.content)
+                if on_token:
+                    on_token(chunk.content)
+            for fragment in chunk.tool_calls:
+                call = calls.setdefault(fragment.index, {"id": None, "name": "", "arguments": []})
+                call["id"] = fragment.id or call["id"]
+                call["name"] = fragment.name or call["name"]
+                call["arguments"].append(fragment.arguments)
+            if chunk.token_usage:
+                token_usage = chunk.token_usage
+
+        tool_calls = [
+            ToolCall(
+                id=call["id"],
+                type="function",
+                function={"name": call["name"], "arguments": "".join(call["arguments"])},
+            )
+            for _, call in sorted(calls.items())
+        ]
+        return AIMessage(
+            content="".join(content) or None,
+            tool_calls=tool_calls or None,
+            token_usage=token_usage
+        )
+
     def invoke(self, 
                input: str | BaseMessage | List[BaseMessage],
-               response_format: BaseModel = None,) -> AIMessage:
+               response_format: BaseModel = None,
+               on_token: Optional[Callable[[str], None]] = None) -> AIMessage:
+        """
+        Get a complete response from the model.
+
+        Args:
+            input: Prompt, message or conversation
+            response_format: Pydantic model to parse the response into
+            on_token: Called with every content delta as it arrives. The
+                response is then streamed, but the same AIMessage is returned.
+
+        When the LLM has a cache, identical requests are answered from it.
+        The returned message records its latency and cost (zero for a cache hit).
+        """
+        started = time.perf_counter()
         messages = self._convert_input(input)
         payload = self._build_payload(messages)
         if response_format:
+            if on_token is not None:
+                raise ValueError("Streaming is not supported with response_format")
             payload.update({"response_format": response_format})
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(payload)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if on_token is not None and cached.content:
+                    on_token(cached.content)
+                return cached.model_copy(update={"latency": time.perf_counter() - started, "cost": 0.0})
+
+        if on_token is not None:
+            message = self._collect(self._stream(payload), on_token)
+        else:
+            message = self._complete(payload, response_format)
+        message.latency = time.perf_counter() - started
+        message.cost = estimate_cost(self.model, message.token_usage)
+
+        if key is not None:
+            self.cache.put(key, message)
+        return message
+
+    def batch(self,
+              inputs: List[str | BaseMessage | List[BaseMessage]],
+              response_format: BaseModel = None,
+              max_concurrency: int = 8,
+              rate_limit: Optional[float] = None,
+              max_retries: int = 5,
+              backoff: float = 1.0) -> List[BatchResult]:
+        """
+        Invoke the model on many inputs concurrently.
+
+        Args:
+            inputs: One prompt, message or conversation per request
+            response_format: Pydantic model to parse every response into
+            max_concurrency: Maximum requests in flight
+            rate_limit: Maximum requests started per second (None for no limit)
+            max_retries: Retries of a request rejected with 429
+            backoff: Base delay before retrying a 429, doubled every attempt.
+                A Retry-After header from the server takes precedence.
+
+        Returns:
+            One BatchResult per input, in input order. A failed request does
+            not stop the batch; its error is kept in the result instead.
+
+        Example:
+            >>> results = llm.batch(prompts, response_format=JudgeEvaluation, rate_limit=5)
+            >>> failed = [r.index for r in results if not r.ok]
+        """
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        def call(index: int) -> BatchResult:
+            for attempt in range(max_retries + 1):
+                if limiter is not None:
+                    limiter.acquire()
+                try:
+                    return BatchResult(index, message=self.invoke(inputs[index], response_format))
+                except RateLimitError as e:
+                    if attempt == max_retries:
+                        return BatchResult(index, error=e)
+                    delay = _retry_after(e) or random.uniform(0, backoff * (2 ** attempt))
+                    time.sleep(delay)
+                except Exception as e:
+                    return BatchResult(index, error=e)
+
+        if not inputs:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(inputs))) as executor:
+            return list(executor.map(call, range(len(inputs))))
+
+    def _complete(self, payload: Dict[str, Any], response_format: BaseModel = None) -> AIMessage:
+        if response_format:
             response = self.client.beta.chat.completions.parse(**payload)
         else:
             response = self.client.chat.completions.create(**payload)
         choice = response.choices[0]
         message = choice.message
 
-        token_usage = None
-        if response.usage:
-            token_usage = TokenUsage(
-                prompt_tokens=response.usage.prompt_tokens,
-                completion_tokens=response.usage.completion_tokens,
-                total_tokens=response.usage.total_tokens
-            )
-
         return AIMessage(
             content=message.content,
             tool_calls=message.tool_calls,
-            token_usage=token_usage
+            token_usage=_token_usage(response.usage)
         )
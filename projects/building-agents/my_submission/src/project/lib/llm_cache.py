@@ -0,0 +1,156 @@
+from typing import Any, Dict, Literal, Optional
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from pydantic import BaseModel
+
+from lib.messages import AIMessage, BaseMessage
+
+
+CacheMode = Literal["auto", "record", "replay"]
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a request has no recorded response"""
+    pass
+
+
+def _canonical(value: Any) -> Any:
+    """Convert a payload value into plain JSON data with a stable layout"""
+    if isinstance(value, type) and issubclass(value, BaseModel):
+        # response_format: the schema, not the class identity, defines the request
+        return {"response_format": value.__name__, "schema": value.model_json_schema()}
+    if isinstance(value, BaseMessage):
+        return _canonical(value.dict())
+    if isinstance(value, BaseModel):
+        return _canonical(value.model_dump())
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    """SHA-256 of the canonical JSON form of a chat completion payload"""
+    payload = dict(payload)
+    if "messages" in payload:
+        # Payloads built elsewhere may still carry response metrics
+        payload["messages"] = [
+            {k: v for k, v in message.items() if k not in AIMessage.local_fields}
+            if isinstance(message, dict) else message
+            for message in payload["messages"]
+        ]
+    data = json.dumps(_canonical(payload), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    On-disk cache of LLM responses, keyed on the request payload.
+
+    The key covers everything sent to the API (model, temperature, messages,
+    tools, response_format), so only identical requests share a response.
+    Meant for evaluation and regression runs at temperature 0.
+
+    Modes:
+        auto: Return cached responses, call the API and store on a miss
+        record: Always call the API and store (overwrite) the response
+        replay: Only return cached responses; a miss raises CacheMissError,
+            so runs are deterministic and never reach the network
+
+    Args:
+        path: SQLite database file, created if missing
+        mode: One of "auto", "record" or "replay"
+        max_entries: Least recently used responses are evicted beyond this
+        ttl: Seconds after which a response is ignored and evicted
+
+    Example:
+        >>> cache = LLMCache("llm_cache.db", mode="replay")
+        >>> llm = LLM(model="gpt-4o-mini", temperature=0, cache=cache)
+    """
+
+    def __init__(self, path: str, mode: CacheMode = "auto",
+                 max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        if mode not in ("auto", "record", "replay"):
+            raise ValueError(f"Invalid cache mode '{mode}'. Expected 'auto', 'record' or 'replay'.")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    def key(self, payload: Dict[str, Any]) -> str:
+        return payload_key(payload)
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        """Return the cached response for a key, or None when the API must be called"""
+        if self.mode == "record":
+            return None
+
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if row is None:
+            if self.mode == "replay":
+                raise CacheMissError(f"No recorded response for request {key[:12]} in {self.path}")
+            return None
+        return AIMessage.model_validate_json(row[0])
+
+    def put(self, key: str, message: AIMessage):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)",
+                (key, message.model_dump_json(), now, now),
+            )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
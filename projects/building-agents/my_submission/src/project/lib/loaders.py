@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterator, List
 import pdfplumber
 from lib.documents import Corpus, Document
 
@@ -18,6 +18,9 @@ class PDFLoader:
     - Automatic page numbering and identification
     - Filtering of empty or whitespace-only pages
     
+    Pages carry their `source` path and `page` number in metadata, which
+    Chunker uses to locate its chunks.
+    
     Example:
         >>> loader = PDFLoader("research_paper.pdf")
         >>> corpus = loader.load()
@@ -27,17 +30,17 @@ class PDFLoader:
     def __init__(self, pdf_path:str):
         self.pdf_path = pdf_path
 
-    def load(self) -> Document:
-        corpus = Corpus()
-
+    def lazy_load(self) -> Iterator[Document]:
+        """Yield pages one at a time, so large files are never held in memory whole"""
         with pdfplumber.open(self.pdf_path) as pdf:
             for num, page in enumerate(pdf.pages, start=1):
                 text = page.extract_text()
                 if text:
-                    corpus.append(
-                        Document(
-                            id=str(num),
-                            content=text
-                        )
+                    yield Document(
+                        id=str(num),
+                        content=text,
+                        metadata={"source": self.pdf_path, "page": num},
                     )
-        return corpus
+
+    def load(self) -> Document:
+        return Corpus(list(self.lazy_load()))
@@ -1,10 +1,10 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 import copy
 
 from lib.documents import Document, Corpus
-from lib.vector_db import VectorStoreManager,QueryResult
+from lib.vector_db import VectorStore, VectorStoreManager, QueryResult
 
 
 class SessionNotFoundError(Exception):
@@ -14,8 +14,15 @@ class SessionNotFoundError(Exception):
 
 @dataclass
 class ShortTermMemory():
-    """Manage the history of objects across multiple sessions"""
+    """Manage the history of objects across multiple sessions
+
+    With `deep_copy=False` objects are stored and returned by reference,
+    which avoids copying the whole history on every add/read. Only use it
+    for objects that are not mutated after being added, such as completed
+    state machine Runs.
+    """
     sessions: Dict[str, List[Any]] = field(default_factory=lambda: {})
+    deep_copy: bool = True
 
     def __post_init__(self):
         """Initialize the default session"""
@@ -61,6 +68,9 @@ class ShortTermMemory():
         del self.sessions[session_id]
         return True
 
+    def _copy(self, object: Any) -> Any:
+        return copy.deepcopy(object) if self.deep_copy else object
+
     def _validate_session(self, session_id: str):
         """Validate that a session exists
         
@@ -85,7 +95,7 @@ class ShortTermMemory():
         """
         session_id = session_id or "default"
         self._validate_session(session_id)
-        self.sessions[session_id].append(copy.deepcopy(object))
+        self.sessions[session_id].append(self._copy(object))
 
     def get_all_objects(self, session_id: Optional[str] = None) -> List[Any]:
         """Get all objects for a session
@@ -101,7 +111,7 @@ class ShortTermMemory():
         """
         session_id = session_id or "default"
         self._validate_session(session_id)
-        return [copy.deepcopy(obj) for obj in self.sessions[session_id]]
+        return [self._copy(obj) for obj in self.sessions[session_id]]
 
     def get_last_object(self, session_id: Optional[str] = None) -> Optional[Any]:
         """Get the most recent object for a session
@@ -115,8 +125,10 @@ class ShortTermMemory():
         Raises:
             SessionNotFoundError: If specified session doesn't exist
         """
-        objects = self.get_all_objects(session_id)
-        return objects[-1] if objects else None
+        session_id = session_id or "default"
+        self._validate_session(session_id)
+        objects = self.sessions[session_id]
+        return self._copy(objects[-1]) if objects else None
 
     def get_all_sessions(self) -> List[str]:
         """Get all session IDs"""
@@ -221,9 +233,15 @@ class LongTermMemory:
     - Namespace-based organization
     - Time-based filtering
     - Semantic similarity search
+
+    Pass a VectorStore (for example a NumpyVectorStore) instead of a manager
+    to keep the memories somewhere else than a fresh ChromaDB collection.
     """
-    def __init__(self, db:VectorStoreManager):
-        self.vector_store = db.create_store("long_term_memory", force=True)
+    def __init__(self, db:Union[VectorStoreManager, VectorStore]):
+        if isinstance(db, VectorStore):
+            self.vector_store = db
+        else:
+            self.vector_store = db.create_store("long_term_memory", force=True)
 
     def get_namespaces(self) -> List[str]:
         """
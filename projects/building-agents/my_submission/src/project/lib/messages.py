@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, Union, List, Dict, Literal
+from pydantic import BaseModel, PrivateAttr
+from typing import ClassVar, FrozenSet, Optional, Union, List, Dict, Literal
 
 from lib.tooling import ToolCall
 
@@ -7,9 +7,32 @@ from lib.tooling import ToolCall
 class BaseMessage(BaseModel):
     role: str
     content: Optional[str] = ""
+    # Serialized form, reused while the message is unchanged
+    _dict: Optional[Dict] = PrivateAttr(default=None)
+    # Client-side fields, never sent to the API
+    local_fields: ClassVar[FrozenSet[str]] = frozenset()
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name != "_dict":
+            self._dict = None
+
+    def model_copy(self, *, update=None, deep: bool = False):
+        copied = super().model_copy(update=update, deep=deep)
+        if update:
+            # `update` bypasses __setattr__, so drop the copied serialization
+            copied._dict = None
+        return copied
 
     def dict(self) -> Dict:
-        return dict(self)
+        """Fields sent to the API, without `local_fields`"""
+        # The history is resent on every turn, so serialize each message once.
+        # Read the private slot directly: pydantic's attribute lookup costs
+        # more than the cache saves.
+        cached = self.__pydantic_private__["_dict"]
+        if cached is None:
+            cached = self._dict = {k: v for k, v in self if k not in self.local_fields}
+        return cached
 
 
 class SystemMessage(BaseMessage):
@@ -31,6 +54,12 @@ class TokenUsage(BaseModel):
     prompt_tokens: int = 0
     completion_tokens: int = 0
     total_tokens: int = 0
+    # Prompt tokens served from the provider's prompt cache
+    cached_tokens: int = 0
+
+    @property
+    def uncached_prompt_tokens(self) -> int:
+        return self.prompt_tokens - self.cached_tokens
 
 
 class AIMessage(BaseMessage):
@@ -38,6 +67,28 @@ class AIMessage(BaseMessage):
     content: Optional[str] = ""
     tool_calls: Optional[List[ToolCall]] = None
     token_usage: Optional[TokenUsage] = None
+    latency: Optional[float] = None  # Seconds spent waiting for the response
+    cost: Optional[float] = None  # USD, see lib.pricing
+    # Metrics of this response; resending them would change every later
+    # request, and with it the LLMCache key
+    local_fields: ClassVar[FrozenSet[str]] = frozenset({"token_usage", "latency", "cost"})
+
+
+class ToolCallChunk(BaseModel):
+    """Fragment of a tool call received while streaming.
+    Fragments with the same `index` belong to the same call; `id` and `name`
+    come with the first fragment, `arguments` is split across all of them."""
+    index: int
+    id: Optional[str] = None
+    name: Optional[str] = None
+    arguments: str = ""
+
+
+class AIMessageChunk(BaseModel):
+    """Incremental piece of an assistant message, yielded by `LLM.stream`"""
+    content: str = ""
+    tool_calls: List[ToolCallChunk] = []
+    token_usage: Optional[TokenUsage] = None
 
 
 AnyMessage = Union[
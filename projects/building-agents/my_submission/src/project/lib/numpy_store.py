@@ -0,0 +1,461 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import json
+import os
+import threading
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction, GetResult, QueryResult
+
+from lib.context import Tokenizer
+from lib.embeddings import normalize_rows
+from lib.documents import Corpus, Document
+from lib.vector_db import IngestionReport, VectorStore
+
+
+_COMPARISONS = {
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first"""
+    if k < len(scores):
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+class NumpyCollection:
+    """
+    In-process replacement for a ChromaDB collection, backed by NumPy.
+
+    Embeddings are normalized and kept in one contiguous float32 matrix, so a
+    query is a matrix product and an `argpartition`, with no client, server
+    or serialization in between. Below `ivf_threshold` documents the search
+    is exact; above it, an IVF index (spherical k-means lists) limits the
+    search to the `n_probe` lists closest to the query. Distances are cosine
+    distances (1 - cosine similarity).
+
+    Metadata filters use the ChromaDB syntax (`$eq`, `$ne`, `$gt`, `$gte`,
+    `$lt`, `$lte`, `$in`, `$nin`, `$and`, `$or`) and are evaluated as boolean
+    masks over per-key columns.
+
+    With a `path`, the matrix lives in the memory-mapped file `<path>.npy`
+    and ids, documents and metadata in `<path>.json`; both are reloaded by
+    the next instance opened on the same path. Writes are kept in memory
+    until `flush` (or `close`), so ingesting in many batches rewrites the
+    JSON file once rather than once per batch; changes not flushed are lost.
+
+    Args:
+        embedding_function: Embeds documents and queries given as text
+        path: File prefix to persist to; in memory when None
+        ivf_threshold: Number of documents above which the IVF index is used
+        n_lists: IVF lists; defaults to the square root of the document count
+        n_probe: IVF lists searched per query
+    """
+
+    def __init__(self, embedding_function: Optional[EmbeddingFunction] = None,
+                 path: Optional[str] = None,
+                 ivf_threshold: int = 20_000,
+                 n_lists: Optional[int] = None,
+                 n_probe: int = 8):
+        self.embedding_function = embedding_function
+        self.path = path
+        self.ivf_threshold = ivf_threshold
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._vectors: Optional[np.ndarray] = None  # (capacity, dimensions)
+        self._columns: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # IVF index: list centroids and the list of every row
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: Optional[np.ndarray] = None
+        self._indexed_size = 0
+        # Rows sorted by list, and where each list starts in that order
+        self._list_order: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._dirty = False  # changes not yet written to `path`
+
+        if path and os.path.exists(f"{path}.json"):
+            self._load()
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    # Storage
+
+    def _load(self):
+        with open(f"{self.path}.json", encoding="utf-8") as f:
+            data = json.load(f)
+        self._ids = data["ids"]
+        self._documents = data["documents"]
+        self._metadatas = data["metadatas"]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._vectors = np.lib.format.open_memmap(f"{self.path}.npy", mode="r+")
+
+    def flush(self):
+        """Write the changes made since the last flush to `path`"""
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            self._vectors.flush()
+            data = {"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas}
+            with open(f"{self.path}.json.tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(f"{self.path}.json.tmp", f"{self.path}.json")
+            self._dirty = False
+
+    def close(self):
+        self.flush()
+
+    def _reserve(self, rows: int, dimensions: int):
+        """Grow the matrix, doubling its capacity, to hold `rows` vectors"""
+        old = self._vectors
+        if old is not None and rows <= len(old):
+            return
+        capacity = max(rows, 2 * len(old) if old is not None else 1024)
+        size = len(self._ids)
+
+        if self.path:
+            new = np.lib.format.open_memmap(
+                f"{self.path}.npy.tmp", mode="w+", dtype=np.float32, shape=(capacity, dimensions)
+            )
+            if old is not None:
+                new[:size] = old[:size]
+            new.flush()
+            del new
+            os.replace(f"{self.path}.npy.tmp", f"{self.path}.npy")
+            self._vectors = np.lib.format.open_memmap(f"{self.path}.npy", mode="r+")
+        else:
+            self._vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+            if old is not None:
+                self._vectors[:size] = old[:size]
+
+        if self._lists is not None:
+            lists = np.full(capacity, -1, dtype=np.int32)
+            lists[:len(self._lists)] = self._lists
+            self._lists = lists
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if self.embedding_function is None:
+            raise ValueError("Pass embeddings, or create the collection with an embedding_function.")
+        return np.asarray(self.embedding_function(texts), dtype=np.float32)
+
+    def upsert(self, ids: List[str],
+               documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Optional[Dict[str, Any]]]] = None,
+               embeddings: Optional[Any] = None):
+        if embeddings is None:
+            embeddings = self._embed(documents)
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+
+        with self._lock:
+            if self._vectors is not None and vectors.shape[1] != self._vectors.shape[1]:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match "
+                    f"the collection dimension {self._vectors.shape[1]}."
+                )
+            new_ids = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in self._rows]
+            self._reserve(len(self._ids) + len(new_ids), vectors.shape[1])
+
+            rows = []
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                row = self._rows.get(doc_id)
+                if row is None:
+                    row = self._rows[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._documents.append(document)
+                    self._metadatas.append(metadata)
+                else:
+                    self._documents[row] = document
+                    self._metadatas[row] = metadata
+                rows.append(row)
+
+            rows = np.asarray(rows, dtype=np.intp)
+            self._vectors[rows] = vectors
+            self._columns.clear()
+            if self._centroids is not None:
+                self._lists[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+                self._list_order = None
+            self._dirty = True
+
+    # Same semantics as upsert: ids are idempotent
+    add = upsert
+
+    # Filters
+
+    def _column(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Values of a metadata key, as objects and as floats (NaN if not a number)"""
+        if key not in self._columns:
+            values = np.empty(len(self._ids), dtype=object)
+            values[:] = [(metadata or {}).get(key) for metadata in self._metadatas]
+            numbers = np.array(
+                [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in values],
+                dtype=np.float64,
+            )
+            self._columns[key] = (values, numbers)
+        return self._columns[key]
+
+    def _condition_mask(self, key: str, condition: Any) -> np.ndarray:
+        values, numbers = self._column(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        mask = np.ones(len(values), dtype=bool)
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                mask &= np.asarray(values == operand, dtype=bool)
+            elif operator == "$ne":
+                mask &= ~np.asarray(values == operand, dtype=bool)
+            elif operator in ("$in", "$nin"):
+                found = np.zeros(len(values), dtype=bool)
+                for item in operand:
+                    found |= np.asarray(values == item, dtype=bool)
+                mask &= found if operator == "$in" else ~found
+            elif operator in _COMPARISONS:
+                # NaN (missing or not a number) never matches
+                mask &= _COMPARISONS[operator](numbers, operand)
+            else:
+                raise ValueError(f"Unsupported metadata operator '{operator}'.")
+        return mask
+
+    def _where_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+            elif key == "$or":
+                matched = np.zeros(len(self._ids), dtype=bool)
+                for clause in condition:
+                    matched |= self._where_mask(clause)
+                mask &= matched
+            else:
+                mask &= self._condition_mask(key, condition)
+        return mask
+
+    def _document_mask(self, where_document: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(len(self._ids), dtype=bool)
+        for operator, operand in where_document.items():
+            if operator == "$and":
+                for clause in operand:
+                    mask &= self._document_mask(clause)
+            elif operator == "$or":
+                matched = np.zeros(len(self._ids), dtype=bool)
+                for clause in operand:
+                    matched |= self._document_mask(clause)
+                mask &= matched
+            elif operator in ("$contains", "$not_contains"):
+                contains = np.fromiter(
+                    (operand in (document or "") for document in self._documents),
+                    dtype=bool, count=len(self._documents),
+                )
+                mask &= contains if operator == "$contains" else ~contains
+            else:
+                raise ValueError(f"Unsupported document operator '{operator}'.")
+        return mask
+
+    def _mask(self, where: Optional[Dict[str, Any]],
+              where_document: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Rows passing both filters, or None when there is no filter"""
+        if not where and not where_document:
+            return None
+        mask = np.ones(len(self._ids), dtype=bool)
+        if where:
+            mask &= self._where_mask(where)
+        if where_document:
+            mask &= self._document_mask(where_document)
+        return mask
+
+    # Search
+
+    def _build_index(self):
+        """Cluster the vectors into IVF lists with spherical k-means"""
+        size = len(self._ids)
+        vectors = self._vectors[:size]
+        n_lists = min(self.n_lists or int(np.sqrt(size)), size)
+        rng = np.random.default_rng(0)
+
+        # Train on a sample, then assign every vector
+        sample = vectors[rng.choice(size, size=min(size, 64 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(10):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            filled = np.bincount(assignments, minlength=n_lists) > 0
+            centroids[filled] = normalize_rows(sums[filled])
+
+        lists = np.full(len(self._vectors), -1, dtype=np.int32)
+        for start in range(0, size, 65_536):
+            end = min(start + 65_536, size)
+            lists[start:end] = np.argmax(vectors[start:end] @ centroids.T, axis=1)
+        self._centroids, self._lists, self._indexed_size = centroids, lists, size
+        self._list_order = None
+
+    def _list_rows(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._list_order is None:
+            lists = self._lists[:len(self._ids)]
+            order = np.argsort(lists, kind="stable")
+            bounds = np.searchsorted(lists[order], np.arange(len(self._centroids) + 1))
+            self._list_order = (order, bounds)
+        return self._list_order
+
+    def _use_index(self) -> bool:
+        size = len(self._ids)
+        if size < self.ivf_threshold:
+            self._centroids = self._lists = self._list_order = None
+            return False
+        # Retrain once the collection has doubled since the last training
+        if self._centroids is None or size > 2 * self._indexed_size:
+            self._build_index()
+        return True
+
+    def _search(self, queries: np.ndarray, k: int,
+                mask: Optional[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Best rows and their similarities, for each query"""
+        size = len(self._ids)
+        allowed = np.flatnonzero(mask) if mask is not None else None
+
+        if self._use_index():
+            order, bounds = self._list_rows()
+            n_probe = min(self.n_probe, len(self._centroids))
+            results = []
+            probed = np.argpartition(-(queries @ self._centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+            for query, probes in zip(queries, probed):
+                candidates = np.concatenate([order[bounds[p]:bounds[p + 1]] for p in probes])
+                if mask is not None:
+                    candidates = candidates[mask[candidates]]
+                if len(candidates) < k:
+                    # Too few candidates in the probed lists: search exactly
+                    candidates = allowed if allowed is not None else np.arange(size)
+                scores = self._vectors[candidates] @ query
+                best = _top_k(scores, k)
+                results.append((candidates[best], scores[best]))
+            return results
+
+        if allowed is None:
+            scores = queries @ self._vectors[:size].T
+            candidates = np.arange(size)
+        else:
+            scores = queries @ self._vectors[allowed].T
+            candidates = allowed
+        results = []
+        for query_scores in scores:
+            best = _top_k(query_scores, k)
+            results.append((candidates[best], query_scores[best]))
+        return results
+
+    def _select(self, rows: np.ndarray, include: List[str]) -> Dict[str, Any]:
+        return {
+            "ids": [self._ids[row] for row in rows],
+            "documents": [self._documents[row] for row in rows] if "documents" in include else None,
+            "metadatas": [self._metadatas[row] for row in rows] if "metadatas" in include else None,
+            "embeddings": self._vectors[rows].copy() if "embeddings" in include else None,
+        }
+
+    def query(self, query_embeddings: Optional[Any] = None,
+              query_texts: Optional[List[str]] = None,
+              n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None,
+              where_document: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None) -> QueryResult:
+        include = include or ["documents", "metadatas", "distances"]
+        if query_embeddings is None:
+            query_embeddings = self._embed(query_texts)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = normalize_rows(queries.reshape(len(queries), -1))
+
+        with self._lock:
+            if not self._ids:
+                found = [(np.array([], dtype=np.intp), np.array([], dtype=np.float32))] * len(queries)
+            else:
+                found = self._search(queries, n_results, self._mask(where, where_document))
+
+            result: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "embeddings": [], "distances": []}
+            for rows, scores in found:
+                selected = self._select(rows, include)
+                for key, value in selected.items():
+                    result[key].append(value)
+                result["distances"].append((1.0 - scores).tolist())
+
+        for key in ("documents", "metadatas", "embeddings", "distances"):
+            if key not in include:
+                result[key] = None
+        result["included"] = include
+        return result
+
+    def get(self, ids: Optional[List[str]] = None,
+            where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None,
+            offset: Optional[int] = None,
+            where_document: Optional[Dict[str, Any]] = None,
+            include: Optional[List[str]] = None) -> GetResult:
+        include = include or ["documents", "metadatas"]
+        with self._lock:
+            if ids is not None:
+                rows = np.array([self._rows[doc_id] for doc_id in ids if doc_id in self._rows], dtype=np.intp)
+            else:
+                rows = np.arange(len(self._ids))
+            mask = self._mask(where, where_document)
+            if mask is not None:
+                rows = rows[mask[rows]]
+            start = offset or 0
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+            result = self._select(rows, include)
+        result["included"] = include
+        return result
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    VectorStore searched in-process with NumPy instead of ChromaDB.
+
+    Meant for small and medium collections (a games corpus, the long-term
+    memory of a user) where a ChromaDB round-trip costs more than the search.
+    The `add`, `ingest`, `query`, `query_many` and `get` methods behave like
+    those of a ChromaDB-backed store; see NumpyCollection for the index.
+    With a `path`, each `ingest` (and so each `add`) is written to disk
+    once, when it ends.
+
+    Args:
+        embedding_function: Embeds documents and queries
+        path: File prefix of the memory-mapped matrix and its metadata;
+            in memory when None
+        ivf_threshold: Number of documents above which the IVF index is used
+        n_lists: IVF lists; defaults to the square root of the document count
+        n_probe: IVF lists searched per query
+        tokenizer: Counts tokens when batching ingestion
+        query_cache_size: Query embeddings kept in the LRU cache
+
+    Example:
+        >>> store = NumpyVectorStore(HashingEmbeddingFunction(), path="chromadb/games")
+        >>> store.add(corpus)
+        >>> store.query(["Pokemon Gold"], n_results=3, where={"platform": "Game Boy Color"})
+    """
+
+    def __init__(self, embedding_function: EmbeddingFunction,
+                 path: Optional[str] = None,
+                 ivf_threshold: int = 20_000,
+                 n_lists: Optional[int] = None,
+                 n_probe: int = 8,
+                 tokenizer: Optional[Tokenizer] = None,
+                 query_cache_size: int = 1024):
+        collection = NumpyCollection(embedding_function, path, ivf_threshold, n_lists, n_probe)
+        super().__init__(collection, embedding_function, tokenizer, query_cache_size)
+
+    def ingest(self, item: Union[Document, Corpus, Iterable[Document]], **kwargs) -> IngestionReport:
+        # Also after a failure: what was upserted stays, and a rerun skips it
+        try:
+            return super().ingest(item, **kwargs)
+        finally:
+            self._collection.flush()
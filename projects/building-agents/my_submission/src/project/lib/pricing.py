@@ -0,0 +1,63 @@
+from typing import Dict, Optional
+from dataclasses import dataclass
+
+from lib.messages import TokenUsage
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    """USD per 1M tokens"""
+    prompt: float
+    completion: float
+    cached_prompt: Optional[float] = None  # None: cached tokens cost the full prompt price
+
+    @property
+    def blended(self) -> float:
+        """Average of prompt and completion prices, for when only totals are known"""
+        return (self.prompt + self.completion) / 2
+
+
+# Public list prices; update when the provider changes them
+MODEL_PRICES: Dict[str, ModelPrice] = {
+    "gpt-4o-mini": ModelPrice(prompt=0.15, completion=0.60, cached_prompt=0.075),
+    "gpt-4o": ModelPrice(prompt=2.50, completion=10.00, cached_prompt=1.25),
+    "gpt-4.1-nano": ModelPrice(prompt=0.10, completion=0.40, cached_prompt=0.025),
+    "gpt-4.1-mini": ModelPrice(prompt=0.40, completion=1.60, cached_prompt=0.10),
+    "gpt-4.1": ModelPrice(prompt=2.00, completion=8.00, cached_prompt=0.50),
+    "gpt-3.5-turbo": ModelPrice(prompt=0.50, completion=1.50),
+    "o3-mini": ModelPrice(prompt=1.10, completion=4.40, cached_prompt=0.55),
+    "o4-mini": ModelPrice(prompt=1.10, completion=4.40, cached_prompt=0.275),
+    "text-embedding-3-small": ModelPrice(prompt=0.02, completion=0.0),
+    "text-embedding-3-large": ModelPrice(prompt=0.13, completion=0.0),
+    "text-embedding-ada-002": ModelPrice(prompt=0.10, completion=0.0),
+}
+
+
+def get_price(model: str) -> Optional[ModelPrice]:
+    """Price of a model, matching dated snapshots like "gpt-4o-mini-2024-07-18" to their family"""
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    # Longest prefix first, so "gpt-4o-mini-..." does not match "gpt-4o"
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_PRICES[name]
+    return None
+
+
+def estimate_cost(model: str, token_usage: Optional[TokenUsage]) -> Optional[float]:
+    """
+    Cost in USD of a single call.
+
+    Returns:
+        The cost, or None if the model is not in MODEL_PRICES or the
+        usage is unknown
+    """
+    price = get_price(model)
+    if price is None or token_usage is None:
+        return None
+    cached_price = price.cached_prompt if price.cached_prompt is not None else price.prompt
+    return (
+        token_usage.uncached_prompt_tokens * price.prompt
+        + token_usage.cached_tokens * cached_price
+        + token_usage.completion_tokens * price.completion
+    ) / 1_000_000
@@ -1,9 +1,9 @@
-from typing import TypedDict, List
+from typing import Callable, TypedDict, List, Optional
 import logging
 
 from lib.state_machine import StateMachine, Step, EntryPoint, Termination, Run, Resource
-from lib.llm import LLM
-from lib.messages import BaseMessage, UserMessage, SystemMessage
+from lib.llm import LLM, Prompt
+from lib.messages import BaseMessage
 from lib.vector_db import VectorStore
 
 
@@ -19,6 +19,7 @@ class RAGState(TypedDict):
     documents: List[str]
     distances: List[float]
     answer: str
+    k: int
 
 class RAG:
     """
@@ -31,8 +32,32 @@ class RAG:
     
     The RAG pattern enhances LLM responses by providing relevant external knowledge,
     reducing hallucinations and improving factual accuracy.
+
+    Args:
+        llm: Model used to generate the answer
+        vector_store: Store queried for context
+        cache_ttl: When set, retrieval and prompt assembly results are cached
+            per question for this many seconds, so repeated questions skip
+            the vector search. Keep it short if the store is being updated.
+        k: Documents retrieved per question, unless `invoke` is given another
+        hybrid: Merge BM25 keyword search with the vector search, so exact
+            names are found even when embeddings rank them low
+        fusion: How hybrid rankings are merged, "rrf" or "weighted"
     """
-    def __init__(self, llm: LLM, vector_store: VectorStore):
+    INSTRUCTIONS = (
+        "You are an assistant for question-answering tasks. "
+        "Use the following pieces of retrieved context to answer the question. "
+        "If you don't know the answer, just say that you don't know."
+    )
+
+    def __init__(self, llm: LLM, vector_store: VectorStore, cache_ttl: Optional[float] = None,
+                 k: int = 3, hybrid: bool = False, fusion: str = "rrf"):
+        self.cache_ttl = cache_ttl
+        self.k = k
+        self.hybrid = hybrid
+        self.fusion = fusion
+        if hybrid and vector_store.lexical_index is None:
+            vector_store.build_lexical_index()
         self.workflow = self._create_state_machine()
         self.resource = Resource(
             vars = {
@@ -44,7 +69,11 @@ class RAG:
     def _retrieve(self, state:RAGState, resource:Resource) -> RAGState:
         question = state["question"]
         vector_store:VectorStore = resource.vars.get("vector_store")
-        results = vector_store.query(query_texts=[question])
+        k = state.get("k") or self.k
+        if self.hybrid:
+            results = vector_store.hybrid_query(question, n_results=k, fusion=self.fusion)
+        else:
+            results = vector_store.query(query_texts=[question], n_results=k)
 
         documents = results['documents'][0] if results['documents'] else []
         distances = results['distances'][0] if results['distances'] else []
@@ -56,36 +85,33 @@ class RAG:
         documents = state["documents"]
         context = "\n\n".join(documents)
 
-        messages = [
-            SystemMessage(content="You are an assistant for question-answering tasks."),
-            UserMessage(
-                content=(
-                    "Use the following pieces of retrieved context to answer the question. "
-                    "If you don't know the answer, just say that you don't know. "
-                    f"\n# Question: \n-> {question} "
-                    f"\n# Context: \n-> {context} "
-                    "\n# Answer: "
-                )
-            )
-        ]
+        # Static instructions first, so every question shares the same prefix
+        messages = Prompt(
+            system=self.INSTRUCTIONS,
+            context=context,
+            query=question,
+        ).to_messages()
 
         return {"messages": messages}
 
     def _generate(self, state:RAGState, resource:Resource) -> RAGState:
         llm:LLM = resource.vars.get("llm")
-        ai_message = llm.invoke(state["messages"])
+        ai_message = llm.invoke(state["messages"], on_token=resource.vars.get("on_token"))
         return {
             "answer": ai_message.content, 
             "messages": state["messages"] + [ai_message],
         }
 
     def _create_state_machine(self) -> StateMachine[RAGState]:
-        machine = StateMachine[RAGState](RAGState)
+        machine = StateMachine[RAGState](RAGState, cache_ttl=self.cache_ttl)
+        cached = self.cache_ttl is not None
 
         # Create steps
         entry = EntryPoint[RAGState]()
-        retrieve = Step[RAGState]("retrieve", self._retrieve)
-        augment = Step[RAGState]("augment", self._augment)
+        retrieve = Step[RAGState]("retrieve", self._retrieve,
+                                  cache_key=["question", "k"] if cached else None)
+        augment = Step[RAGState]("augment", self._augment,
+                                 cache_key=["question", "documents"] if cached else None)
         generate = Step[RAGState]("generate", self._generate)
         termination = Termination[RAGState]()
 
@@ -97,7 +123,23 @@ class RAG:
 
         return machine
 
-    def invoke(self, query: str) -> Run:
+    @staticmethod
+    def _record_stats(run: Run):
+        """Expose the cost and latency of the answer in the run metadata"""
+        final_state = run.get_final_state() or {}
+        messages = final_state.get("messages") or []
+        answer = messages[-1] if messages else None
+        run.stats["cost"] = getattr(answer, "cost", None) or 0.0
+        run.stats["llm_time"] = getattr(answer, "latency", None) or 0.0
+        run.stats["overhead_time"] = max(0.0, run.duration - run.stats["llm_time"])
+
+    def _resource(self, on_token: Optional[Callable[[str], None]]) -> Resource:
+        if on_token is None:
+            return self.resource
+        return Resource(vars={**self.resource.vars, "on_token": on_token})
+
+    def invoke(self, query: str, on_token: Optional[Callable[[str], None]] = None,
+               k: Optional[int] = None) -> Run:
         """
         Execute the complete RAG pipeline for a given query.
         
@@ -107,6 +149,8 @@ class RAG:
         
         Args:
             query (str): The user's question or search query
+            on_token (Callable, optional): Receives the answer text as it is generated
+            k (int, optional): Documents to retrieve for this query
             
         Returns:
             Run: Execution object containing the final state and pipeline results
@@ -119,9 +163,39 @@ class RAG:
         
         initial_state: RAGState = {
             "question": query,
+            "k": k or self.k,
         }
         run_object = self.workflow.run(
             state = initial_state, 
-            resource = self.resource,
+            resource = self._resource(on_token),
+        )
+        self._record_stats(run_object)
+        return run_object
+
+    async def ainvoke(self, query: str, on_token: Optional[Callable[[str], None]] = None,
+                      k: Optional[int] = None) -> Run:
+        """
+        Async variant of `invoke`.
+        
+        The pipeline runs on the current event loop, so many queries can be
+        answered concurrently with `asyncio.gather`.
+        
+        Args:
+            query (str): The user's question or search query
+            on_token (Callable, optional): Receives the answer text as it is
+                generated, from an executor thread
+            k (int, optional): Documents to retrieve for this query
+            
+        Returns:
+            Run: Execution object containing the final state and pipeline results
+        """
+        initial_state: RAGState = {
+            "question": query,
+            "k": k or self.k,
+        }
+        run_object = await self.workflow.arun(
+            state = initial_state,
+            resource = self._resource(on_token),
         )
+        self._record_stats(run_object)
         return run_object
@@ -0,0 +1,139 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import heapq
+import math
+import re
+import threading
+
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words; single characters are kept, so "Mortal Kombat X" keeps its "x" """
+    return _WORD.findall((text or "").lower())
+
+
+class BM25Index:
+    """
+    Inverted index scoring documents with Okapi BM25.
+
+    The index is incremental: `add` inserts or replaces documents and only
+    touches the postings of their terms, so it can follow every write to a
+    vector store without being rebuilt.
+
+    Args:
+        k1: Term frequency saturation
+        b: Length normalization, from 0 (none) to 1 (full)
+        tokenizer: Splits text into terms
+
+    Example:
+        >>> index = BM25Index()
+        >>> index.add(["mk10"], ["Mortal Kombat X is a fighting game"])
+        >>> index.search("mortal kombat x", k=5)
+        [('mk10', 1.73...)]
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75,
+                 tokenizer: Callable[[str], List[str]] = tokenize):
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._terms: Dict[str, List[str]] = {}  # distinct terms of each document
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def _remove(self, doc_id: str):
+        if doc_id not in self._lengths:
+            return
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in self._terms.pop(doc_id):
+            del self._postings[term][doc_id]
+            if not self._postings[term]:
+                del self._postings[term]
+
+    def add(self, ids: Sequence[str], documents: Sequence[Optional[str]]):
+        """Index documents, replacing those already indexed under the same id"""
+        tokenized = [(doc_id, self.tokenizer(document)) for doc_id, document in zip(ids, documents)]
+        with self._lock:
+            for doc_id, terms in tokenized:
+                self._remove(doc_id)
+                counts: Dict[str, int] = {}
+                for term in terms:
+                    counts[term] = counts.get(term, 0) + 1
+                for term, count in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = count
+                self._lengths[doc_id] = len(terms)
+                self._terms[doc_id] = list(counts)
+                self._total_length += len(terms)
+
+    def remove(self, ids: Sequence[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Best `k` documents for a query, as (id, score) pairs, best first"""
+        terms = set(self.tokenizer(query))
+        with self._lock:
+            n_documents = len(self._lengths)
+            if not n_documents:
+                return []
+            average_length = self._total_length / n_documents or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, count in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]],
+                           weights: Optional[Sequence[float]] = None,
+                           k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Merge rankings by summing `weight / (k + rank)` over the rankings of each id.
+
+    Only ranks are used, so rankings with incomparable scores (cosine
+    distances and BM25) can be merged without calibration.
+
+    Returns:
+        (id, score) pairs, best first
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_fusion(scores: Sequence[Dict[str, float]],
+                    weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """
+    Merge scored results by a weighted sum of min-max normalized scores.
+
+    Higher scores must be better in every input; an id missing from one
+    input scores 0 there.
+
+    Returns:
+        (id, score) pairs, best first
+    """
+    weights = weights or [1.0] * len(scores)
+    fused: Dict[str, float] = {}
+    for result, weight in zip(scores, weights):
+        if not result:
+            continue
+        low, high = min(result.values()), max(result.values())
+        for doc_id, score in result.items():
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
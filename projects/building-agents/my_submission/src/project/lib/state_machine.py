@@ -1,21 +1,146 @@
-from typing import Any, Callable, Dict, List, Optional, Union, TypeVar, Generic, cast, Type, TypedDict, get_type_hints
+from typing import Any, Callable, Collection, Dict, Hashable, Iterator, List, Optional, Tuple, Union, TypeVar, Generic, cast, Type, TypedDict, get_type_hints
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from functools import lru_cache
 from datetime import datetime
+import asyncio
+import itertools
+import random
+import threading
+import time
 import uuid
-import copy
 import inspect
 
+from lib.tracing import Tracer, NullTracer
+from lib.checkpoints import CheckpointStore, CheckpointRecord
+
 
 StateSchema = TypeVar("StateSchema")
 
+@lru_cache(maxsize=None)
+def schema_fields(state_schema: Type) -> Dict[str, Any]:
+    """Field types of a state schema, resolved once per schema"""
+    return get_type_hints(state_schema)
+
+
 @dataclass
 class Resource:
     vars: Dict[str, Any]
 
+class StepTimeoutError(TimeoutError):
+    """Raised when a step runs longer than the timeout of its policy"""
+    pass
+
+
+class RunCancelledError(Exception):
+    """Raised when a run is stopped through its CancellationToken"""
+    pass
+
+
+class DeadlineExceededError(RunCancelledError):
+    """Raised when a run exceeds its run-wide timeout"""
+    pass
+
+
+class CancellationToken:
+    """
+    Flag used to stop a running workflow from another thread or task.
+
+    The state machine checks it before every step and while waiting on a
+    step that has a timeout. A step that is already running is abandoned,
+    not interrupted: Python threads cannot be killed.
+
+    Example:
+        >>> token = CancellationToken()
+        >>> future = pool.submit(machine.run, state, resource, cancel_token=token)
+        >>> token.cancel("shutting down")
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        self.reason = reason
+        self._event.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleep until cancelled or `timeout` elapsed; returns whether cancelled"""
+        return self._event.wait(timeout)
+
+
+@dataclass
+class StepPolicy:
+    """
+    How a step is executed when it is slow or fails.
+
+    Args:
+        timeout: Seconds a single attempt may take before StepTimeoutError
+        max_retries: Attempts made after the first one fails
+        backoff: Base delay in seconds, doubled after every failed attempt
+        max_backoff: Upper bound on the delay between attempts
+        jitter: Pick a random delay up to the computed one, so that runs
+            failing together do not retry together
+        retry_on: Exception types worth retrying; others fail immediately
+        fallback: Step to continue with once retries are exhausted, instead
+            of failing the run. The failed step contributes no updates.
+
+    Example:
+        >>> policy = StepPolicy(timeout=30, max_retries=2, fallback="apologize")
+        >>> llm_step = Step[AgentState]("llm_processor", self._llm_step, policy=policy)
+    """
+    timeout: Optional[float] = None
+    max_retries: int = 0
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+    jitter: bool = True
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,)
+    fallback: Optional[str] = None
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retrying after the given (0-based) failed attempt"""
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+# Steps without a policy run once, without timeout
+DEFAULT_POLICY = StepPolicy()
+
+
+def _freeze(value: Any) -> Hashable:
+    """Turn a state value into something usable as a cache key"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
 class Step(Generic[StateSchema]):
-    def __init__(self, step_id: str, logic: Callable[[StateSchema], Dict]):
+    def __init__(self, step_id: str, logic: Callable[[StateSchema], Dict],
+                 cache_key: Optional[Union[List[str], Callable[[StateSchema], Hashable]]] = None,
+                 policy: Optional[StepPolicy] = None):
+        """
+        Args:
+            step_id: Unique name of the step in the workflow
+            logic: Function of (state) or (state, resource) returning the updated fields
+            cache_key: Makes the step cacheable. Either the state fields its result
+                depends on, or a function computing a hashable key from the state.
+                Only use it for deterministic steps.
+            policy: Timeout, retries and fallback of the step; see StepPolicy
+        """
         self.step_id = step_id
         self.logic = logic
+        self.cache_key = cache_key
+        self.policy = policy or DEFAULT_POLICY
         # Store the number of parameters the logic function expects
         self.logic_params_count = self._calculate_params_count()
 
@@ -34,27 +159,62 @@ class Step(Generic[StateSchema]):
             # For regular functions
             return self.logic.__code__.co_argcount
 
-    def run(self, state: StateSchema, state_schema: Type[StateSchema], resource: Resource=None) -> StateSchema:
+    @property
+    def cacheable(self) -> bool:
+        return self.cache_key is not None
+
+    def make_cache_key(self, state: StateSchema) -> Hashable:
+        """Key identifying this step's result for the given state"""
+        if callable(self.cache_key):
+            return (self.step_id, self.cache_key(state))
+        return (self.step_id, tuple(_freeze(state.get(f)) for f in self.cache_key))
+
+    @property
+    def is_async(self) -> bool:
+        """Whether the logic is a coroutine function that must be awaited"""
+        return inspect.iscoroutinefunction(self.logic)
+
+    def _call_logic(self, state: StateSchema, resource: Resource=None) -> Any:
         # Call logic function with appropriate number of arguments
         if self.logic_params_count == 1:
-            result = self.logic(state)
+            return self.logic(state)
         elif self.logic_params_count == 2:
-            result = self.logic(state, resource)
+            return self.logic(state, resource)
         else:
             raise ValueError(
                 f"Step '{self.step_id}' logic function must accept either 1 argument (state) "
                 f"or 2 arguments (state, resource). Found {self.logic_params_count} arguments."
             ) 
+
+    @staticmethod
+    def _filter_fields(result: Dict, expected_fields: Collection[str]) -> Dict[str, Any]:
+        # Only keep fields that are defined in state_schema
+        return {
+            field: value for field, value in result.items()
+            if field in expected_fields
+        }
+
+    def execute(self, state: StateSchema, expected_fields: Collection[str], resource: Resource=None) -> Dict[str, Any]:
+        """Call the step logic and return only the schema fields it updated"""
+        if self.is_async:
+            raise TypeError(f"Step '{self.step_id}' has async logic. Use StateMachine.arun() instead.")
+        result = self._call_logic(state, resource)
+        return self._filter_fields(result, expected_fields)
+
+    async def aexecute(self, state: StateSchema, expected_fields: Collection[str], resource: Resource=None) -> Dict[str, Any]:
+        """Async variant of `execute`.
+        Coroutine logic is awaited; sync logic is offloaded to the loop's default
+        executor so that it does not block other runs on the same event loop."""
+        if self.is_async:
+            result = await self._call_logic(state, resource)
+            return self._filter_fields(result, expected_fields)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.execute, state, expected_fields, resource)
+
+    def run(self, state: StateSchema, state_schema: Type[StateSchema], resource: Resource=None) -> StateSchema:
         # Get expected fields from the TypedDict
-        expected_fields = get_type_hints(state_schema)
-        
-        # Create new state with all fields from state_schema
-        # Only copy fields that are defined in state_schema
-        updated = {**state}
-        for field, value in result.items():
-            if field in expected_fields:
-                updated[field] = value
-        
+        expected_fields = schema_fields(state_schema)
+        updated = {**state, **self.execute(state, expected_fields, resource)}
         return cast(StateSchema, updated)
 
 
@@ -72,6 +232,42 @@ class Termination(Step[StateSchema]):
         super().__init__("__termination__", lambda x: {})
 
 
+class Join(Step[StateSchema]):
+    """Special step where parallel branches meet again.
+    When a transition resolves to several targets, each target starts a branch
+    that runs until it reaches a Join (or Termination). The updates of all
+    branches are merged field by field before the Join step itself runs.
+    Fields written by more than one branch are combined with the reducer
+    registered for that field, e.g. `{"documents": operator.add}`."""
+    def __init__(self, step_id: str, reducers: Optional[Dict[str, Callable[[Any, Any], Any]]] = None):
+        super().__init__(step_id, lambda x: {})
+        self.reducers = reducers or {}
+
+    def merge(self, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge the partial updates of several branches, in branch order"""
+        return merge_updates(updates, self.reducers, self.step_id)
+
+
+def merge_updates(updates: List[Dict[str, Any]],
+                  reducers: Dict[str, Callable[[Any, Any], Any]],
+                  step_id: str) -> Dict[str, Any]:
+    """Merge partial state updates field by field.
+    Conflicting writes without a reducer are only accepted when equal."""
+    merged: Dict[str, Any] = {}
+    for update in updates:
+        for field, value in update.items():
+            if field not in merged:
+                merged[field] = value
+            elif field in reducers:
+                merged[field] = reducers[field](merged[field], value)
+            elif merged[field] != value:
+                raise ValueError(
+                    f"Join '{step_id}': field '{field}' was updated by more than one branch. "
+                    f"Register a reducer for it."
+                )
+    return merged
+
+
 @dataclass
 class Transition(Generic[StateSchema]):
     source: str
@@ -99,31 +295,111 @@ class Transition(Generic[StateSchema]):
 
 @dataclass
 class Snapshot(Generic[StateSchema]):
-    """Represents a single state snapshot in time"""
+    """Represents a single state snapshot in time.
+
+    Only the fields changed by the step are stored in `changes`; unchanged
+    values are shared with the parent snapshot instead of being copied.
+    The full state is rebuilt on demand through `state_data`. Values are
+    stored by reference, so steps must return new values rather than
+    mutating the state they receive.
+    """
     snapshot_id: str
     timestamp: datetime
-    state_data: StateSchema
+    changes: Dict[str, Any]
     state_schema: Type[StateSchema]
     step_id: str
+    branch: Optional[str] = None
+    # Step taken next instead of the normal transition, when the step failed over
+    fallback: Optional[str] = None
+    parent: Optional['Snapshot[StateSchema]'] = field(default=None, repr=False, compare=False)
+    _state: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
 
     def __str__(self) -> str:
-        return f"Snapshot('{self.snapshot_id}') @ [{self.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')}]: {self.step_id}.State({self.state_data})"
+        step = f"{self.branch}:{self.step_id}" if self.branch else self.step_id
+        return f"Snapshot('{self.snapshot_id}') @ [{self.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')}]: {step}.State({self.state_data})"
 
     def __repr__(self) -> str:
         return self.__str__()
 
+    @property
+    def state_data(self) -> StateSchema:
+        """The full state at this snapshot, rebuilt from the parent chain"""
+        if self._state is None:
+            # Walk up to the closest snapshot whose state is already known
+            chain = []
+            node = self
+            while node is not None and node._state is None:
+                chain.append(node)
+                node = node.parent
+            state = node._state if node is not None else {}
+            for snapshot in reversed(chain):
+                state = {**state, **snapshot.changes}
+                snapshot._state = state
+        return cast(StateSchema, dict(self._state))
+
     @classmethod
-    def create(cls, state_data: StateSchema, state_schema: Type[StateSchema],
-               step_id:str) -> 'Snapshot[StateSchema]':
+    def create(cls, changes: Dict[str, Any], state_schema: Type[StateSchema],
+               step_id:str, branch: Optional[str] = None,
+               parent: Optional['Snapshot[StateSchema]'] = None,
+               fallback: Optional[str] = None) -> 'Snapshot[StateSchema]':
         return cls(
             snapshot_id=str(uuid.uuid4()),
             timestamp=datetime.now(),
-            state_data=state_data,
+            changes=changes,
             state_schema=state_schema,
             step_id=step_id,
+            branch=branch,
+            fallback=fallback,
+            parent=parent,
         )
 
 
+@dataclass
+class CacheEntry:
+    updates: Dict[str, Any]
+    duration: float
+    created_at: float
+
+
+class StepCache:
+    """
+    Bounded cache of step results, shared by all runs of a StateMachine.
+
+    Entries are evicted least-recently-used first once `max_size` is
+    reached, and expire `ttl` seconds after they were stored.
+    """
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and time.monotonic() - entry.created_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, updates: Dict[str, Any], duration: float):
+        with self._lock:
+            self._entries[key] = CacheEntry(updates, duration, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
 @dataclass
 class Run(Generic[StateSchema]):
     """Represents a single execution run of the state machine"""
@@ -131,6 +407,8 @@ class Run(Generic[StateSchema]):
     start_timestamp: datetime
     snapshots: List[Snapshot[StateSchema]] = field(default_factory=list)
     end_timestamp: Optional[datetime] = None
+    # Extra figures reported in `metadata` (cache hits, ...)
+    stats: Dict[str, Any] = field(default_factory=dict)
 
     def __str__(self) -> str:
         return f"Run('{self.run_id}')"
@@ -145,13 +423,20 @@ class Run(Generic[StateSchema]):
             start_timestamp=datetime.now()
         )
 
+    @property
+    def duration(self) -> float:
+        """Wall-clock seconds of the run (so far, if it is not complete)"""
+        end = self.end_timestamp or datetime.now()
+        return (end - self.start_timestamp).total_seconds()
+
     @property
     def metadata(self) -> Dict:
         return {
             "run_id": self.run_id,
             "start_timestamp": self.start_timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
             "end_timestamp": self.end_timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
-            "snapshot_counts": len(self.snapshots)
+            "snapshot_counts": len(self.snapshots),
+            **self.stats,
         }
 
     def add_snapshot(self, snapshot: Snapshot[StateSchema]):
@@ -170,13 +455,25 @@ class Run(Generic[StateSchema]):
 
 
 class StateMachine(Generic[StateSchema]):
-    def __init__(self, state_schema: Type[StateSchema]):
+    def __init__(self, state_schema: Type[StateSchema], max_workers: Optional[int] = None,
+                 tracer: Optional[Tracer] = None,
+                 checkpoints: Optional[CheckpointStore] = None,
+                 cache_size: int = 256, cache_ttl: Optional[float] = None):
         self.state_schema = state_schema
         self.steps: Dict[str, Step[StateSchema]] = {}
         self.transitions: Dict[str, List[Transition[StateSchema]]] = {}
+        # Upper bound on branches running at once (None = one thread per branch)
+        self.max_workers = max_workers
+        # Receives step timings and errors; see lib.tracing
+        self.tracer = tracer
+        # Persists every snapshot so runs can be resumed; see lib.checkpoints
+        self.checkpoints = checkpoints
+        # Results of cacheable steps, shared across runs
+        self.cache = StepCache(max_size=cache_size, ttl=cache_ttl)
+        self._compiled: Optional['CompiledStateMachine[StateSchema]'] = None
 
     def __str__(self) -> str:
-        schema_keys = list(get_type_hints(self.state_schema).keys())
+        schema_keys = list(schema_fields(self.state_schema))
         return f"StateMachine(schema={schema_keys})"
 
     def __repr__(self) -> str:
@@ -186,6 +483,7 @@ class StateMachine(Generic[StateSchema]):
         """Add steps to the workflow"""
         for step in steps:
             self.steps[step.step_id] = step
+        self._compiled = None
 
     def connect(
         self,
@@ -200,58 +498,641 @@ class StateMachine(Generic[StateSchema]):
         if src_id not in self.transitions:
             self.transitions[src_id] = []
         self.transitions[src_id].append(transition)
+        self._compiled = None
+
+    def compile(self) -> 'CompiledStateMachine[StateSchema]':
+        """Validate the graph once and freeze it into a runner.
+
+        Checks that there is exactly one EntryPoint, that every declared
+        transition source and target exists, and that a Termination step is
+        reachable from the entry point. The result is cached until steps or
+        transitions change.
 
-    def run(self, state: StateSchema, resource: Resource = None):
-        # Validate that state has at least one field from the schema
-        expected_fields = get_type_hints(self.state_schema)
-        state_fields = set(state.keys())
-        common_fields = state_fields.intersection(expected_fields)
-        
-        if not common_fields:
-            raise ValueError(f"Initial state must have at least one field from the schema. Expected fields: {list(expected_fields.keys())}")
+        Raises:
+            Exception: If the graph is invalid
+        """
+        if self._compiled is not None:
+            return self._compiled
 
         entry_points = [s for s in self.steps.values() if isinstance(s, EntryPoint)]
         if not entry_points:
             raise Exception("No EntryPoint step found in workflow")
         if len(entry_points) > 1:
             raise Exception("Multiple EntryPoint steps found in workflow")
-        
-        # Create a new run for this execution
-        current_run = Run.create()
-        
-        current_step_id = entry_points[0].step_id        
+        entry_id = entry_points[0].step_id
 
-        while current_step_id:
-            step = self.steps[current_step_id]
-            if isinstance(step, Termination):
-                print(f"[StateMachine] Terminating: {current_step_id}")
-                break
-            
-            # Replace state entirely
-            state = step.run(state, self.state_schema, resource)  
+        for src_id, transitions in self.transitions.items():
+            if src_id not in self.steps:
+                raise Exception(f"Transition source '{src_id}' is not a step of the workflow")
+            for t in transitions:
+                missing = [target for target in t.targets if target not in self.steps]
+                if missing:
+                    raise Exception(f"Transition from '{src_id}' targets unknown steps: {missing}")
+        for step in self.steps.values():
+            if step.policy.fallback is not None and step.policy.fallback not in self.steps:
+                raise Exception(f"Step '{step.step_id}' falls back to unknown step '{step.policy.fallback}'")
+
+        # Walk the declared targets to make sure the workflow can terminate
+        reachable = {entry_id}
+        frontier = [entry_id]
+        while frontier:
+            step_id = frontier.pop()
+            targets = [target for t in self.transitions.get(step_id, []) for target in t.targets]
+            if self.steps[step_id].policy.fallback is not None:
+                targets.append(self.steps[step_id].policy.fallback)
+            for target in targets:
+                if target not in reachable:
+                    reachable.add(target)
+                    frontier.append(target)
+        if not any(isinstance(self.steps[s], Termination) for s in reachable):
+            raise Exception("No Termination step is reachable from the EntryPoint")
+
+        self._compiled = CompiledStateMachine[StateSchema](
+            state_schema=self.state_schema,
+            steps=self.steps,
+            transitions=self.transitions,
+            entry_id=entry_id,
+            max_workers=self.max_workers,
+            tracer=self.tracer,
+            checkpoints=self.checkpoints,
+            cache=self.cache,
+        )
+        return self._compiled
+
+    def run(self, state: StateSchema, resource: Resource = None,
+            timeout: Optional[float] = None, cancel_token: Optional[CancellationToken] = None):
+        """Run the workflow.
+
+        Args:
+            state: Initial state
+            resource: Shared objects passed to steps taking two arguments
+            timeout: Run-wide deadline in seconds; DeadlineExceededError is
+                raised once it has passed
+            cancel_token: Token that stops the run with RunCancelledError
+        """
+        return self.compile().run(state, resource, timeout, cancel_token)
+
+    async def arun(self, state: StateSchema, resource: Resource = None,
+                   timeout: Optional[float] = None, cancel_token: Optional[CancellationToken] = None):
+        """Run the workflow on the current event loop.
+
+        Async step logic is awaited and sync logic runs in the loop's default
+        executor, so many runs can be interleaved with `asyncio.gather`.
+        """
+        return await self.compile().arun(state, resource, timeout, cancel_token)
+
+    def resume(self, run_id: str, resource: Resource = None,
+               timeout: Optional[float] = None, cancel_token: Optional[CancellationToken] = None):
+        """Continue an interrupted run from its last checkpointed step.
+
+        Completed steps are not executed again. Branches of a fan-out that
+        was interrupted before reaching its Join are executed again.
+        """
+        return self.compile().resume(run_id, resource, timeout, cancel_token)
+
+    async def aresume(self, run_id: str, resource: Resource = None,
+                      timeout: Optional[float] = None, cancel_token: Optional[CancellationToken] = None):
+        """Async counterpart of `resume`"""
+        return await self.compile().aresume(run_id, resource, timeout, cancel_token)
+
+
+@dataclass
+class RunContext(Generic[StateSchema]):
+    """Everything a single execution needs besides the state itself"""
+    run: Run[StateSchema]
+    resource: Optional[Resource] = None
+    # Order in which snapshots were taken, used as checkpoint sequence numbers
+    seq: Iterator[int] = field(default_factory=itertools.count)
+    # Guards run.stats, which parallel branches update concurrently
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    cancel_token: Optional[CancellationToken] = None
+    # time.monotonic() value after which the run is abandoned
+    deadline: Optional[float] = None
 
-            if isinstance(step, EntryPoint):
-                print(f"[StateMachine] Starting: {current_step_id}")
+    # How often a waiting run looks at its token and deadline
+    POLL_INTERVAL = 0.05
+
+    def check(self):
+        """Raise if the run was cancelled or its deadline has passed"""
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise RunCancelledError(f"Run {self.run.run_id} cancelled: {self.cancel_token.reason}")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise DeadlineExceededError(f"Run {self.run.run_id} exceeded its deadline")
+
+    def time_limit(self, timeout: Optional[float]) -> Optional[float]:
+        """Monotonic time at which a step started now must be abandoned"""
+        end = None if timeout is None else time.monotonic() + timeout
+        if self.deadline is not None:
+            end = self.deadline if end is None else min(end, self.deadline)
+        return end
+
+    @property
+    def interruptible(self) -> bool:
+        return self.cancel_token is not None or self.deadline is not None
+
+    def wait_interval(self, end: Optional[float]) -> Optional[float]:
+        """How long to block before looking at the token and deadline again"""
+        interval = self.POLL_INTERVAL if self.cancel_token is not None else None
+        if end is not None:
+            remaining = max(0.0, end - time.monotonic())
+            interval = remaining if interval is None else min(interval, remaining)
+        return interval
+
+    def backoff(self, delay: float) -> float:
+        """Delay before a retry, cut short so it never sleeps past the deadline"""
+        if self.deadline is not None:
+            delay = min(delay, max(0.0, self.deadline - time.monotonic()))
+        return delay
+
+    async def asleep(self, delay: float):
+        """Async backoff sleep, woken early by the token like `CancellationToken.wait`"""
+        end = time.monotonic() + self.backoff(delay)
+        while time.monotonic() < end and not (self.cancel_token is not None and self.cancel_token.cancelled):
+            await asyncio.sleep(self.wait_interval(end))
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.run.stats[name] = self.run.stats.get(name, 0) + amount
+
+
+class CompiledStateMachine(Generic[StateSchema]):
+    """Frozen, validated view of a StateMachine, produced by `StateMachine.compile()`.
+    Schema fields and lookup tables are computed once, so executing a step
+    is a logic call plus a dict merge."""
+    def __init__(self, state_schema: Type[StateSchema],
+                 steps: Dict[str, Step[StateSchema]],
+                 transitions: Dict[str, List[Transition[StateSchema]]],
+                 entry_id: str,
+                 max_workers: Optional[int] = None,
+                 tracer: Optional[Tracer] = None,
+                 checkpoints: Optional[CheckpointStore] = None,
+                 cache: Optional[StepCache] = None):
+        self.state_schema = state_schema
+        self.fields = frozenset(schema_fields(state_schema))
+        self.steps = dict(steps)
+        self.transitions = {src: tuple(ts) for src, ts in transitions.items()}
+        self.entry_id = entry_id
+        self.max_workers = max_workers
+        self.tracer = tracer or NullTracer()
+        self.checkpoints = checkpoints
+        self.cache = cache or StepCache()
+
+    def __str__(self) -> str:
+        return f"CompiledStateMachine(steps={list(self.steps)})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def _next_steps(self, step_id: str, state: StateSchema) -> List[str]:
+        """Resolve all transitions leaving a step"""
+        next_steps: List[str] = []
+        for t in self.transitions.get(step_id, []):
+            next_steps += t.resolve(state)
+
+        if not next_steps:
+            raise Exception(f"[StateMachine] No transitions found from step: {step_id}")
+        return next_steps
+
+    def _validate(self, state: StateSchema):
+        """Validate that state has at least one field from the schema"""
+        if self.fields.isdisjoint(state.keys()):
+            raise ValueError(f"Initial state must have at least one field from the schema. Expected fields: {list(schema_fields(self.state_schema))}")
+
+    def _record(self, ctx: RunContext[StateSchema], step: Step[StateSchema], changes: Dict[str, Any],
+                snapshots: List[Snapshot[StateSchema]], branch: Optional[str] = None,
+                parent: Optional[Snapshot[StateSchema]] = None,
+                fallback: Optional[str] = None) -> Snapshot[StateSchema]:
+        """Snapshot the fields changed since the parent snapshot and checkpoint it"""
+        snapshot = Snapshot.create(changes, self.state_schema, step.step_id, branch, parent, fallback)
+        snapshots.append(snapshot)
+        if self.checkpoints is not None:
+            self.checkpoints.save([CheckpointRecord(
+                run_id=ctx.run.run_id,
+                seq=next(ctx.seq),
+                snapshot_id=snapshot.snapshot_id,
+                parent_id=parent.snapshot_id if parent else None,
+                step_id=snapshot.step_id,
+                branch=branch,
+                timestamp=snapshot.timestamp,
+                changes=changes,
+                fallback=fallback,
+            )])
+        return snapshot
+
+    def _merge_branches(self, targets: List[str], results: List[Tuple[StateSchema, Dict[str, Any], str]],
+                        branch_snapshots: List[List[Snapshot[StateSchema]]],
+                        snapshots: List[Snapshot[StateSchema]]) -> Tuple[Dict[str, Any], str]:
+        """Merge finished sibling branches at the step where they met"""
+        # Keep snapshots grouped per branch, in declaration order
+        for branch_list in branch_snapshots:
+            snapshots.extend(branch_list)
+
+        stop_ids = {stop_id for _, _, stop_id in results}
+        if len(stop_ids) > 1:
+            raise Exception(f"[StateMachine] Parallel branches {targets} did not meet at a single step: {sorted(stop_ids)}")
+        stop_id = stop_ids.pop()
+
+        join = self.steps[stop_id]
+        reducers = join.reducers if isinstance(join, Join) else {}
+        merged = merge_updates([updates for _, updates, _ in results], reducers, stop_id)
+        return merged, stop_id
+
+    def _cache_lookup(self, ctx: RunContext[StateSchema], step: Step[StateSchema],
+                      state: StateSchema) -> Tuple[Optional[Hashable], Optional[Dict[str, Any]]]:
+        """Return the cache key of a cacheable step and its cached updates, if any"""
+        if not step.cacheable:
+            return None, None
+        key = step.make_cache_key(state)
+        entry = self.cache.get(key)
+        if entry is None:
+            ctx.count("cache_misses")
+            return key, None
+        ctx.count("cache_hits")
+        ctx.count("cache_time_saved", entry.duration)
+        return key, dict(entry.updates)
+
+    def _timed_out(self, ctx: RunContext[StateSchema], step: Step[StateSchema], end: Optional[float]):
+        """Raise the error explaining why a step is being abandoned"""
+        ctx.check()
+        if end is not None and time.monotonic() >= end:
+            raise StepTimeoutError(f"Step '{step.step_id}' timed out after {step.policy.timeout}s")
+
+    def _call_step(self, ctx: RunContext[StateSchema], step: Step[StateSchema],
+                   state: StateSchema) -> Dict[str, Any]:
+        """Execute one attempt of a step, bounded by its timeout and the run deadline"""
+        end = ctx.time_limit(step.policy.timeout)
+        if end is None and not ctx.interruptible:
+            return step.execute(state, self.fields, ctx.resource)
+
+        # Run the logic on a daemon thread so that a hung step can be abandoned
+        done = threading.Event()
+        outcome: Dict[str, Any] = {}
+
+        def target():
+            try:
+                outcome["result"] = step.execute(state, self.fields, ctx.resource)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=target, name=f"step-{step.step_id}", daemon=True).start()
+        while not done.wait(ctx.wait_interval(end)):
+            self._timed_out(ctx, step, end)
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    async def _acall_step(self, ctx: RunContext[StateSchema], step: Step[StateSchema],
+                          state: StateSchema) -> Dict[str, Any]:
+        """Async counterpart of `_call_step`; an abandoned step task is cancelled"""
+        end = ctx.time_limit(step.policy.timeout)
+        if end is None and not ctx.interruptible:
+            return await step.aexecute(state, self.fields, ctx.resource)
+
+        task = asyncio.ensure_future(step.aexecute(state, self.fields, ctx.resource))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=ctx.wait_interval(end))
+                if done:
+                    return task.result()
+                self._timed_out(ctx, step, end)
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def _handle_failure(self, ctx: RunContext[StateSchema], step: Step[StateSchema], error: Exception,
+                        attempt: int, branch: Optional[str]) -> Optional[float]:
+        """Decide what to do after a failed attempt.
+
+        Returns:
+            The delay before the next attempt, or None to use the fallback step.
+
+        Raises:
+            The error itself when it cannot be retried and there is no fallback
+        """
+        self._step_failed(ctx, step, error, branch)
+        policy = step.policy
+        if isinstance(error, RunCancelledError) or not isinstance(error, policy.retry_on):
+            raise error
+        if attempt < policy.max_retries:
+            ctx.count("retries")
+            return policy.delay(attempt)
+        if policy.fallback is None:
+            raise error
+        ctx.count("fallbacks")
+        return None
+
+    def _invoke(self, ctx: RunContext[StateSchema], step: Step[StateSchema], state: StateSchema,
+                started: float, branch: Optional[str]) -> Tuple[Dict[str, Any], Optional[str]]:
+        """Execute a step according to its cache entry and policy.
+
+        Returns:
+            The step updates, and the fallback step to continue with when the
+            step failed for good (None otherwise).
+        """
+        key, cached = self._cache_lookup(ctx, step, state)
+        if cached is not None:
+            return cached, None
+
+        attempt = 0
+        while True:
+            ctx.check()
+            try:
+                updates = self._call_step(ctx, step, state)
+                break
+            except Exception as e:
+                delay = self._handle_failure(ctx, step, e, attempt, branch)
+                if delay is None:
+                    return {}, step.policy.fallback
+            # The next ctx.check() raises if the deadline ran out meanwhile
+            delay = ctx.backoff(delay)
+            if ctx.cancel_token is not None:
+                ctx.cancel_token.wait(delay)
             else:
-                print(f"[StateMachine] Executing step: {current_step_id}")
+                time.sleep(delay)
+            attempt += 1
 
-            # Create and add snapshot to the current run
-            snapshot = Snapshot.create(copy.deepcopy(state), self.state_schema, current_step_id)
-            current_run.add_snapshot(snapshot)
+        if key is not None:
+            self.cache.put(key, updates, time.perf_counter() - started)
+        return updates, None
 
-            transitions = self.transitions.get(current_step_id, [])
-            next_steps: List[str] = []
+    async def _ainvoke(self, ctx: RunContext[StateSchema], step: Step[StateSchema], state: StateSchema,
+                       started: float, branch: Optional[str]) -> Tuple[Dict[str, Any], Optional[str]]:
+        """Async counterpart of `_invoke`"""
+        key, cached = self._cache_lookup(ctx, step, state)
+        if cached is not None:
+            return cached, None
 
-            for t in transitions:
-                next_steps += t.resolve(state)
+        attempt = 0
+        while True:
+            ctx.check()
+            try:
+                updates = await self._acall_step(ctx, step, state)
+                break
+            except Exception as e:
+                delay = self._handle_failure(ctx, step, e, attempt, branch)
+                if delay is None:
+                    return {}, step.policy.fallback
+            await ctx.asleep(delay)
+            attempt += 1
 
-            if not next_steps:
-                raise Exception(f"[StateMachine] No transitions found from step: {current_step_id}")
+        if key is not None:
+            self.cache.put(key, updates, time.perf_counter() - started)
+        return updates, None
+
+    def _step_started(self, ctx: RunContext[StateSchema], step: Step[StateSchema],
+                      branch: Optional[str]) -> float:
+        self.tracer.on_step_start(ctx.run.run_id, step.step_id, branch)
+        return time.perf_counter()
+
+    def _step_failed(self, ctx: RunContext[StateSchema], step: Step[StateSchema],
+                     error: BaseException, branch: Optional[str]):
+        self.tracer.on_error(ctx.run.run_id, step.step_id, error, branch)
+
+    def _step_finished(self, ctx: RunContext[StateSchema], step: Step[StateSchema], started: float,
+                       state: StateSchema, changes: Dict[str, Any], branch: Optional[str]):
+        duration = time.perf_counter() - started
+        self.tracer.on_step_end(ctx.run.run_id, step.step_id, duration, state, changes, branch)
+
+    def _execute(self, ctx: RunContext[StateSchema], step_id: str, state: StateSchema,
+                 snapshots: List[Snapshot[StateSchema]],
+                 branch: Optional[str] = None,
+                 parent: Optional[Snapshot[StateSchema]] = None,
+                 pending: Optional[Dict[str, Any]] = None) -> Tuple[StateSchema, Dict[str, Any], str]:
+        """Run steps starting at `step_id` until the workflow (or branch) stops.
+
+        The main line stops at Termination. A branch also stops right before a
+        Join, which is then executed by the caller once all siblings are done.
+        `pending` holds updates not yet covered by a snapshot, such as merged
+        branch results when a resumed run continues at a Join.
+
+        Returns:
+            The resulting state, the fields updated along the way and the id of
+            the step where execution stopped.
+        """
+        updates: Dict[str, Any] = {}
+        # Fields changed since the last snapshot; the first snapshot of a run holds the full state
+        pending = dict(state) if parent is None else dict(pending or {})
+
+        while True:
+            step = self.steps[step_id]
+            if isinstance(step, Termination):
+                if branch is None and pending:
+                    # Branches that met at Termination still need their merged snapshot
+                    parent = self._record(ctx, step, pending, snapshots, branch, parent)
+                return state, updates, step_id
+
+            started = self._step_started(ctx, step, branch)
+            step_updates, fallback = self._invoke(ctx, step, state, started, branch)
+            state = cast(StateSchema, {**state, **step_updates})
+            self._step_finished(ctx, step, started, state, step_updates, branch)
+            updates.update(step_updates)
+            pending.update(step_updates)
+            parent = self._record(ctx, step, pending, snapshots, branch, parent, fallback)
+            pending = {}
+
+            next_steps = [fallback] if fallback else self._next_steps(step_id, state)
+            self.tracer.on_transition(ctx.run.run_id, step_id, next_steps, branch)
+
+            if len(next_steps) > 1:
+                join_updates, step_id = self._fan_out(ctx, next_steps, state, snapshots, branch, parent)
+                state = cast(StateSchema, {**state, **join_updates})
+                updates.update(join_updates)
+                # The join snapshot records the merged branch updates
+                pending.update(join_updates)
+                # The join step runs next, even inside a branch
+                continue
+
+            step_id = next_steps[0]
+            if branch is not None and isinstance(self.steps[step_id], Join):
+                return state, updates, step_id
+
+    def _fan_out(self, ctx: RunContext[StateSchema], targets: List[str], state: StateSchema,
+                 snapshots: List[Snapshot[StateSchema]],
+                 parent_branch: Optional[str] = None,
+                 parent: Optional[Snapshot[StateSchema]] = None) -> Tuple[Dict[str, Any], str]:
+        """Run sibling branches concurrently and merge their updates.
+
+        Every branch works on its own shallow copy of the state, so steps must
+        return new values instead of mutating the state in place.
+
+        Returns:
+            The merged updates of all branches and the id of the step where
+            the branches met.
+        """
+        labels = [f"{parent_branch}/{t}" if parent_branch else t for t in targets]
+        branch_snapshots: List[List[Snapshot[StateSchema]]] = [[] for _ in targets]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers or len(targets)) as executor:
+            futures = [
+                executor.submit(self._execute, ctx, target, cast(StateSchema, dict(state)),
+                                branch_snapshots[i], labels[i], parent)
+                for i, target in enumerate(targets)
+            ]
+            results = [f.result() for f in futures]
+
+        return self._merge_branches(targets, results, branch_snapshots, snapshots)
+
+    async def _aexecute(self, ctx: RunContext[StateSchema], step_id: str, state: StateSchema,
+                        snapshots: List[Snapshot[StateSchema]],
+                        branch: Optional[str] = None,
+                        parent: Optional[Snapshot[StateSchema]] = None,
+                        pending: Optional[Dict[str, Any]] = None) -> Tuple[StateSchema, Dict[str, Any], str]:
+        """Async counterpart of `_execute`"""
+        updates: Dict[str, Any] = {}
+        # Fields changed since the last snapshot; the first snapshot of a run holds the full state
+        pending = dict(state) if parent is None else dict(pending or {})
+
+        while True:
+            step = self.steps[step_id]
+            if isinstance(step, Termination):
+                if branch is None and pending:
+                    # Branches that met at Termination still need their merged snapshot
+                    parent = self._record(ctx, step, pending, snapshots, branch, parent)
+                return state, updates, step_id
+
+            started = self._step_started(ctx, step, branch)
+            step_updates, fallback = await self._ainvoke(ctx, step, state, started, branch)
+            state = cast(StateSchema, {**state, **step_updates})
+            self._step_finished(ctx, step, started, state, step_updates, branch)
+            updates.update(step_updates)
+            pending.update(step_updates)
+            parent = self._record(ctx, step, pending, snapshots, branch, parent, fallback)
+            pending = {}
+
+            next_steps = [fallback] if fallback else self._next_steps(step_id, state)
+            self.tracer.on_transition(ctx.run.run_id, step_id, next_steps, branch)
 
             if len(next_steps) > 1:
-                raise NotImplementedError("Parallel execution not implemented yet.")
+                join_updates, step_id = await self._afan_out(ctx, next_steps, state, snapshots, branch, parent)
+                state = cast(StateSchema, {**state, **join_updates})
+                updates.update(join_updates)
+                # The join snapshot records the merged branch updates
+                pending.update(join_updates)
+                # The join step runs next, even inside a branch
+                continue
+
+            step_id = next_steps[0]
+            if branch is not None and isinstance(self.steps[step_id], Join):
+                return state, updates, step_id
+
+    async def _afan_out(self, ctx: RunContext[StateSchema], targets: List[str], state: StateSchema,
+                        snapshots: List[Snapshot[StateSchema]],
+                        parent_branch: Optional[str] = None,
+                        parent: Optional[Snapshot[StateSchema]] = None) -> Tuple[Dict[str, Any], str]:
+        """Async counterpart of `_fan_out`: sibling branches run as tasks on the current loop"""
+        labels = [f"{parent_branch}/{t}" if parent_branch else t for t in targets]
+        branch_snapshots: List[List[Snapshot[StateSchema]]] = [[] for _ in targets]
+
+        results = await asyncio.gather(*[
+            self._aexecute(ctx, target, cast(StateSchema, dict(state)),
+                           branch_snapshots[i], labels[i], parent)
+            for i, target in enumerate(targets)
+        ])
+
+        return self._merge_branches(targets, list(results), branch_snapshots, snapshots)
+
+    @staticmethod
+    def _limit(ctx: RunContext[StateSchema], timeout: Optional[float],
+               cancel_token: Optional[CancellationToken]) -> RunContext[StateSchema]:
+        ctx.cancel_token = cancel_token
+        if timeout is not None:
+            ctx.deadline = time.monotonic() + timeout
+        return ctx
+
+    def _start(self, state: StateSchema, resource: Optional[Resource],
+               timeout: Optional[float] = None,
+               cancel_token: Optional[CancellationToken] = None) -> RunContext[StateSchema]:
+        self._validate(state)
+        # Create a new run for this execution
+        ctx = self._limit(RunContext[StateSchema](run=Run.create(), resource=resource),
+                          timeout, cancel_token)
+        self.tracer.on_run_start(ctx.run.run_id, state)
+        return ctx
 
-            current_step_id = next_steps[0]
+    def _finish(self, ctx: RunContext[StateSchema]) -> Run[StateSchema]:
+        ctx.run.complete()
+        self.tracer.on_run_end(ctx.run.run_id, ctx.run.duration)
+        return ctx.run
 
-        current_run.complete()
-        return current_run
+    def run(self, state: StateSchema, resource: Resource = None,
+            timeout: Optional[float] = None, cancel_token: Optional[CancellationToken] = None):
+        ctx = self._start(state, resource, timeout, cancel_token)
+        self._execute(ctx, self.entry_id, state, ctx.run.snapshots)
+        return self._finish(ctx)
+
+    async def arun(self, state: StateSchema, resource: Resource = None,
+                   timeout: Optional[float] = None, cancel_token: Optional[CancellationToken] = None):
+        """Async counterpart of `run`"""
+        ctx = self._start(state, resource, timeout, cancel_token)
+        await self._aexecute(ctx, self.entry_id, state, ctx.run.snapshots)
+        return self._finish(ctx)
+
+    def _restore(self, run_id: str, resource: Optional[Resource]) -> Tuple[RunContext[StateSchema], StateSchema, Snapshot[StateSchema]]:
+        """Rebuild a run from its checkpoints, up to the last completed main-line step"""
+        if self.checkpoints is None:
+            raise ValueError("Resuming requires a StateMachine created with a checkpoint store")
+        records = self.checkpoints.load(run_id)
+        main_line = [i for i, r in enumerate(records) if r.branch is None]
+        if not main_line:
+            raise ValueError(f"No checkpoints found for run '{run_id}'")
+        # Branch records after the last main-line step belong to an unfinished
+        # fan-out, which is executed again from the start
+        records = records[:main_line[-1] + 1]
+
+        run = Run[StateSchema](run_id=run_id, start_timestamp=records[0].timestamp)
+        by_id: Dict[str, Snapshot[StateSchema]] = {}
+        for record in records:
+            snapshot = Snapshot[StateSchema](
+                snapshot_id=record.snapshot_id,
+                timestamp=record.timestamp,
+                changes=record.changes,
+                state_schema=self.state_schema,
+                step_id=record.step_id,
+                branch=record.branch,
+                fallback=record.fallback,
+                parent=by_id.get(record.parent_id),
+            )
+            by_id[snapshot.snapshot_id] = snapshot
+            run.add_snapshot(snapshot)
+
+        ctx = RunContext[StateSchema](run=run, resource=resource,
+                                      seq=itertools.count(records[-1].seq + 1))
+        last = run.snapshots[-1]
+        self.tracer.on_run_start(run_id, last.state_data)
+        return ctx, last.state_data, last
+
+    def resume(self, run_id: str, resource: Resource = None,
+               timeout: Optional[float] = None,
+               cancel_token: Optional[CancellationToken] = None) -> Run[StateSchema]:
+        """Continue a run from its last checkpointed step without executing it again"""
+        ctx, state, last = self._restore(run_id, resource)
+        self._limit(ctx, timeout, cancel_token)
+        if not isinstance(self.steps[last.step_id], Termination):
+            next_steps = [last.fallback] if last.fallback else self._next_steps(last.step_id, state)
+            pending: Dict[str, Any] = {}
+            if len(next_steps) > 1:
+                pending, step_id = self._fan_out(ctx, next_steps, state, ctx.run.snapshots, None, last)
+                state = cast(StateSchema, {**state, **pending})
+            else:
+                step_id = next_steps[0]
+            self._execute(ctx, step_id, state, ctx.run.snapshots, parent=last, pending=pending)
+        return self._finish(ctx)
+
+    async def aresume(self, run_id: str, resource: Resource = None,
+                      timeout: Optional[float] = None,
+                      cancel_token: Optional[CancellationToken] = None) -> Run[StateSchema]:
+        """Async counterpart of `resume`"""
+        ctx, state, last = self._restore(run_id, resource)
+        self._limit(ctx, timeout, cancel_token)
+        if not isinstance(self.steps[last.step_id], Termination):
+            next_steps = [last.fallback] if last.fallback else self._next_steps(last.step_id, state)
+            pending: Dict[str, Any] = {}
+            if len(next_steps) > 1:
+                pending, step_id = await self._afan_out(ctx, next_steps, state, ctx.run.snapshots, None, last)
+                state = cast(StateSchema, {**state, **pending})
+            else:
+                step_id = next_steps[0]
+            await self._aexecute(ctx, step_id, state, ctx.run.snapshots, parent=last, pending=pending)
+        return self._finish(ctx)
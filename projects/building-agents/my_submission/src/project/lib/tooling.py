@@ -102,6 +102,10 @@ class Tool:
             }
         }
 
+    @property
+    def is_async(self) -> bool:
+        return inspect.iscoroutinefunction(self.func)
+
     def __call__(self, *args, **kwargs):
         return self.func(*args, **kwargs)
 
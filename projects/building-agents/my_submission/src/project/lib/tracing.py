@@ -0,0 +1,194 @@
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field, asdict
+from collections import deque
+from datetime import datetime
+import atexit
+import json
+import sys
+import threading
+
+
+@dataclass
+class TraceEvent:
+    """A single event emitted while a state machine run executes"""
+    event: str
+    run_id: str
+    timestamp: datetime = field(default_factory=datetime.now)
+    step_id: Optional[str] = None
+    branch: Optional[str] = None
+    duration: Optional[float] = None
+    state_size: Optional[int] = None
+    changed_fields: Optional[List[str]] = None
+    targets: Optional[List[str]] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {k: v for k, v in asdict(self).items() if v is not None}
+        data["timestamp"] = self.timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")
+        return data
+
+
+def state_size(state: Dict[str, Any]) -> int:
+    """Shallow size of a state in bytes (top-level values only, so it stays cheap)"""
+    return sum(sys.getsizeof(value) for value in state.values())
+
+
+class Tracer:
+    """
+    Hook interface called by the state machine while a run executes.
+
+    Every hook is a no-op here, so subclasses only override what they need.
+    Hooks may be called from several threads when branches run in parallel,
+    and they run inline with the workflow, so they should be cheap.
+    """
+
+    def on_run_start(self, run_id: str, state: Dict[str, Any]):
+        pass
+
+    def on_step_start(self, run_id: str, step_id: str, branch: Optional[str] = None):
+        pass
+
+    def on_step_end(self, run_id: str, step_id: str, duration: float,
+                    state: Dict[str, Any], changes: Dict[str, Any],
+                    branch: Optional[str] = None):
+        pass
+
+    def on_transition(self, run_id: str, source: str, targets: List[str],
+                      branch: Optional[str] = None):
+        pass
+
+    def on_error(self, run_id: str, step_id: str, error: BaseException,
+                 branch: Optional[str] = None):
+        pass
+
+    def on_run_end(self, run_id: str, duration: float):
+        pass
+
+
+# The default tracer: does nothing
+NullTracer = Tracer
+
+
+class ConsoleTracer(Tracer):
+    """Print one line per step, like the state machine used to do"""
+
+    def on_step_end(self, run_id, step_id, duration, state, changes, branch=None):
+        suffix = f" (branch: {branch})" if branch else ""
+        print(f"[StateMachine] Executing step: {step_id}{suffix} [{duration * 1000:.1f} ms]")
+
+    def on_error(self, run_id, step_id, error, branch=None):
+        print(f"[StateMachine] Step {step_id} failed: {error!r}")
+
+    def on_run_end(self, run_id, duration):
+        print(f"[StateMachine] Terminating run {run_id} [{duration * 1000:.1f} ms]")
+
+
+class EventTracer(Tracer):
+    """Base class for tracers that turn hook calls into TraceEvents"""
+
+    def record(self, event: TraceEvent):
+        raise NotImplementedError
+
+    def on_run_start(self, run_id, state):
+        self.record(TraceEvent(event="run_start", run_id=run_id, state_size=state_size(state)))
+
+    def on_step_start(self, run_id, step_id, branch=None):
+        self.record(TraceEvent(event="step_start", run_id=run_id, step_id=step_id, branch=branch))
+
+    def on_step_end(self, run_id, step_id, duration, state, changes, branch=None):
+        self.record(TraceEvent(
+            event="step_end", run_id=run_id, step_id=step_id, branch=branch,
+            duration=duration, state_size=state_size(state),
+            changed_fields=list(changes),
+        ))
+
+    def on_transition(self, run_id, source, targets, branch=None):
+        self.record(TraceEvent(event="transition", run_id=run_id, step_id=source,
+                               branch=branch, targets=list(targets)))
+
+    def on_error(self, run_id, step_id, error, branch=None):
+        self.record(TraceEvent(event="error", run_id=run_id, step_id=step_id,
+                               branch=branch, error=repr(error)))
+
+    def on_run_end(self, run_id, duration):
+        self.record(TraceEvent(event="run_end", run_id=run_id, duration=duration))
+
+
+class RingBufferTracer(EventTracer):
+    """
+    Keep the most recent trace events in memory.
+
+    Only the last `capacity` events are kept, so it can stay enabled in
+    long-running processes. Use `step_stats()` to find hot steps.
+
+    Example:
+        >>> tracer = RingBufferTracer(capacity=5000)
+        >>> machine = StateMachine[AgentState](AgentState, tracer=tracer)
+        >>> ...
+        >>> tracer.step_stats()["llm_processor"]["mean"]
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.events: deque = deque(maxlen=capacity)
+
+    def record(self, event: TraceEvent):
+        # deque.append is atomic, no lock needed
+        self.events.append(event)
+
+    def clear(self):
+        self.events.clear()
+
+    def step_stats(self) -> Dict[str, Dict[str, float]]:
+        """Aggregate wall time per step over the buffered events"""
+        stats: Dict[str, Dict[str, float]] = {}
+        for event in list(self.events):
+            if event.event != "step_end":
+                continue
+            entry = stats.setdefault(event.step_id, {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += event.duration
+            entry["max"] = max(entry["max"], event.duration)
+        for entry in stats.values():
+            entry["mean"] = entry["total"] / entry["count"]
+        return stats
+
+
+class JsonlTracer(EventTracer):
+    """
+    Append trace events to a JSON Lines file.
+
+    Events are buffered in memory and written in one go when the buffer is
+    full, so steps do not pay for file I/O. Remaining events are flushed at
+    interpreter exit, or explicitly with `flush()`.
+
+    Args:
+        path: File to append to
+        buffer_size: Number of events kept before writing to disk
+    """
+
+    def __init__(self, path: str, buffer_size: int = 100):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer: List[TraceEvent] = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def record(self, event: TraceEvent):
+        with self._lock:
+            self._buffer.append(event)
+            if len(self._buffer) >= self.buffer_size:
+                self._write()
+
+    def flush(self):
+        """Write any buffered events to disk"""
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        # Called with the lock held, so lines from different runs never interleave
+        if not self._buffer:
+            return
+        lines = "".join(json.dumps(event.to_dict()) + "\n" for event in self._buffer)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self._buffer = []
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("chromadb")
+
+from openai.types.chat import ChatCompletionMessageToolCall
+
+from lib import agents
+from lib.messages import AIMessage, SystemMessage, TokenUsage
+from lib.tooling import tool
+
+
+class FakeLLM:
+    """Asks for `echo` while it has tool calls enabled, answers otherwise"""
+    requests = []
+
+    def __init__(self, model=None, temperature=0.0, tools=None, tool_choice=None, **kwargs):
+        self.final = tool_choice == "none"
+
+    def invoke(self, messages, **kwargs):
+        FakeLLM.requests.append(list(messages))
+        if self.final:
+            return AIMessage(content="final answer", token_usage=TokenUsage(total_tokens=10))
+        call = ChatCompletionMessageToolCall(
+            id=f"call_{len(FakeLLM.requests)}",
+            type="function",
+            function={"name": "echo", "arguments": json.dumps({"x": 1})},
+        )
+        return AIMessage(content=None, tool_calls=[call], token_usage=TokenUsage(total_tokens=100))
+
+
+@tool
+def echo(x: int) -> int:
+    """Return x"""
+    return x
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    FakeLLM.requests = []
+    monkeypatch.setattr(agents, "LLM", FakeLLM)
+    return FakeLLM
+
+
+def test_final_answer_instruction_is_not_kept_in_history(fake_llm):
+    agent = agents.Agent("model", "instructions", tools=[echo], max_iterations=2)
+
+    run = agent.invoke("question")
+    state = run.get_final_state()
+
+    assert run.metadata["stop_reason"] == "max_iterations"
+    assert state["messages"][-1].content == "final answer"
+    assert isinstance(fake_llm.requests[-1][-1], SystemMessage)
+    assert not any(
+        isinstance(message, SystemMessage) and "final answer" in message.content
+        for message in state["messages"]
+    )
+
+
+@tool
+async def async_echo(x: int) -> int:
+    """Return x"""
+    return x
+
+
+def test_single_async_tool_call_inside_running_event_loop(fake_llm):
+    agent = agents.Agent("model", "instructions", tools=[async_echo], max_iterations=1)
+    call = ChatCompletionMessageToolCall(
+        id="call_1",
+        type="function",
+        function={"name": "async_echo", "arguments": json.dumps({"x": 3})},
+    )
+    state = {"messages": [], "current_tool_calls": [call], "session_id": "s"}
+
+    async def inside_loop():
+        # Like a notebook cell: the step runs on a thread with a running loop
+        return agent._tool_step(state)
+
+    updates = asyncio.run(inside_loop())
+
+    assert updates["messages"][-1].content == json.dumps("3")
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+pytest.importorskip("chromadb")
+
+from openai.types.chat import ChatCompletionMessageToolCall
+
+from lib import agents, evaluation
+from lib.context import ContextManager
+from lib.messages import AIMessage, TokenUsage
+from lib.tooling import tool
+
+
+class FakeLLM:
+    """Calls `echo` once, then answers"""
+
+    def __init__(self, model=None, temperature=0.0, tools=None, tool_choice=None, **kwargs):
+        self.calls = 0
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        if self.calls > 1:
+            return AIMessage(content="done", token_usage=TokenUsage(total_tokens=10))
+        call = ChatCompletionMessageToolCall(
+            id="call_1",
+            type="function",
+            function={"name": "echo", "arguments": json.dumps({"x": 1})},
+        )
+        return AIMessage(content=None, tool_calls=[call], token_usage=TokenUsage(total_tokens=10))
+
+
+@tool
+def echo(x: int) -> int:
+    """Return x"""
+    return x
+
+
+@pytest.mark.parametrize("with_context_manager", [False, True])
+def test_steps_taken_ignores_context_manager(monkeypatch, with_context_manager):
+    monkeypatch.setattr(agents, "LLM", FakeLLM)
+    monkeypatch.setattr(evaluation, "LLM", FakeLLM)
+    context_manager = ContextManager(policies=[]) if with_context_manager else None
+    agent = agents.Agent("model", "instructions", tools=[echo], context_manager=context_manager)
+    run = agent.invoke("question")
+    test_case = evaluation.TestCase(
+        id="echo", description="Echo", user_query="question", expected_tools=["echo"], max_steps=4,
+    )
+
+    result = evaluation.AgentEvaluator().evaluate_trajectory(test_case, run)
+
+    # message_prep, llm_processor, tool_executor, llm_processor
+    assert result.task_completion.steps_taken == 4
+    assert result.task_completion.task_completed
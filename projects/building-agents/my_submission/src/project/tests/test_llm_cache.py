@@ -0,0 +1,14 @@
+from lib.llm_cache import payload_key
+from lib.messages import AIMessage, TokenUsage, UserMessage
+
+
+def test_response_metrics_do_not_change_the_cache_key():
+    recorded = AIMessage(content="Hi", token_usage=TokenUsage(total_tokens=12), latency=0.8, cost=0.001)
+    replayed = AIMessage(content="Hi", token_usage=TokenUsage(total_tokens=12), latency=0.2, cost=0.001)
+    question = UserMessage(content="Next?")
+
+    assert "latency" not in recorded.dict()
+    assert payload_key({"model": "m", "messages": [recorded.dict(), question.dict()]}) == \
+        payload_key({"model": "m", "messages": [replayed.dict(), question.dict()]})
+    assert payload_key({"model": "m", "messages": [dict(recorded)]}) == \
+        payload_key({"model": "m", "messages": [AIMessage(content="Hi").dict()]})
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+from typing import TypedDict
+
+import pytest
+
+from lib.checkpoints import FileCheckpointStore, SQLiteCheckpointStore
+from lib.state_machine import (
+    CancellationToken, DeadlineExceededError, EntryPoint, RunCancelledError, StateMachine, Step,
+    StepPolicy, Termination,
+)
+
+
+class State(TypedDict):
+    question: str
+    out: str
+
+
+def build_fallback_machine(store, crash_in_fallback):
+    """`work` always fails and falls back to `fb`; `ok` is its normal successor"""
+    def work(state):
+        raise ConnectionError("upstream down")
+
+    def fb(state):
+        if crash_in_fallback["on"]:
+            raise RuntimeError("crash")
+        return {"out": "fallback path"}
+
+    machine = StateMachine[State](State, checkpoints=store)
+    entry, termination = EntryPoint[State](), Termination[State]()
+    work_step = Step[State]("work", work, policy=StepPolicy(fallback="fb"))
+    ok_step = Step[State]("ok", lambda state: {"out": "normal path"})
+    fb_step = Step[State]("fb", fb)
+    machine.add_steps([entry, work_step, ok_step, fb_step, termination])
+    machine.connect(entry, work_step)
+    machine.connect(work_step, ok_step)
+    machine.connect(ok_step, termination)
+    machine.connect(fb_step, termination)
+    return machine
+
+
+@pytest.fixture(params=["sqlite", "file"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteCheckpointStore(str(tmp_path / "checkpoints.db"))
+    return FileCheckpointStore(str(tmp_path / "checkpoints"))
+
+
+def crashed_run_id(store, machine):
+    with pytest.raises(RuntimeError, match="crash"):
+        machine.run({"question": "q"})
+    if isinstance(store, SQLiteCheckpointStore):
+        return store._conn.execute("SELECT run_id FROM checkpoints").fetchone()[0]
+    return next(Path(store.directory).glob("*.ckpt")).stem
+
+
+def test_resume_after_fallback_continues_on_fallback(store):
+    crash = {"on": True}
+    machine = build_fallback_machine(store, crash)
+    run_id = crashed_run_id(store, machine)
+
+    crash["on"] = False
+    run = machine.resume(run_id)
+
+    assert run.get_final_state()["out"] == "fallback path"
+    steps = [snapshot.step_id for snapshot in run.snapshots]
+    assert steps[-2:] == ["work", "fb"]
+    assert "ok" not in steps
+
+
+def test_aresume_after_fallback_continues_on_fallback(store):
+    crash = {"on": True}
+    machine = build_fallback_machine(store, crash)
+    run_id = crashed_run_id(store, machine)
+
+    crash["on"] = False
+    run = asyncio.run(machine.aresume(run_id))
+
+    assert run.get_final_state()["out"] == "fallback path"
+
+
+def build_failing_machine(logic):
+    machine = StateMachine[State](State)
+    entry, termination = EntryPoint[State](), Termination[State]()
+    step = Step[State]("work", logic, policy=StepPolicy(max_retries=3, backoff=2.0, jitter=False))
+    machine.add_steps([entry, step, termination])
+    machine.connect(entry, step)
+    machine.connect(step, termination)
+    return machine
+
+
+def test_retry_backoff_stops_at_run_deadline():
+    def work(state):
+        raise ConnectionError("upstream down")
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        build_failing_machine(work).run({"question": "q"}, timeout=0.3)
+    assert time.monotonic() - started < 1.0
+
+
+def test_async_retry_backoff_stops_at_run_deadline():
+    async def work(state):
+        raise ConnectionError("upstream down")
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(build_failing_machine(work).arun({"question": "q"}, timeout=0.3))
+    assert time.monotonic() - started < 1.0
+
+
+@pytest.mark.parametrize("is_async", [False, True])
+def test_cancel_during_retry_backoff_stops_promptly(is_async):
+    def work(state):
+        raise ConnectionError("upstream down")
+
+    async def awork(state):
+        raise ConnectionError("upstream down")
+
+    machine = build_failing_machine(awork if is_async else work)
+    token = CancellationToken()
+    threading.Timer(0.2, token.cancel).start()
+
+    started = time.monotonic()
+    with pytest.raises(RunCancelledError):
+        if is_async:
+            asyncio.run(machine.arun({"question": "q"}, cancel_token=token))
+        else:
+            machine.run({"question": "q"}, cancel_token=token)
+    assert time.monotonic() - started < 1.0
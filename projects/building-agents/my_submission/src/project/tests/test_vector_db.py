@@ -0,0 +1,84 @@
+import pytest
+
+pytest.importorskip("chromadb")
+
+from lib.documents import Document
+from lib.embeddings import HashingEmbeddingFunction
+from lib import numpy_store
+from lib.numpy_store import NumpyCollection, NumpyVectorStore
+
+
+@pytest.fixture
+def store():
+    return NumpyVectorStore(HashingEmbeddingFunction(dimensions=256))
+
+
+def test_metadata_comes_back_as_stored(store):
+    metadata = {"title": "Mortal Kombat X", "platform": "PlayStation 4", "content_hash": "mine"}
+    store.add([
+        Document(id="mk10", content="Mortal Kombat X is a fighting game", metadata=dict(metadata)),
+        Document(id="gt", content="Gran Turismo is a racing game"),
+    ])
+
+    assert store.get(ids=["mk10"])["metadatas"] == [metadata]
+    assert store.get(ids=["gt"])["metadatas"] == [None]
+    assert store.query("fighting game", n_results=1)["metadatas"] == [[metadata]]
+    assert store.hybrid_query("Mortal Kombat X", n_results=1)["metadatas"] == [[metadata]]
+
+
+def test_ingest_skips_unchanged_documents(store):
+    documents = [Document(id="mk10", content="Mortal Kombat X", metadata={"year": 2015})]
+
+    assert store.ingest(documents).documents == 1
+    report = store.ingest(documents)
+
+    assert report.skipped == 1
+    assert report.documents == 0
+
+
+def test_ingest_streams_an_iterator():
+    embedding_function = HashingEmbeddingFunction(dimensions=64)
+    read = []
+    read_at_embed = []
+
+    def embed(texts):
+        read_at_embed.append(len(read))
+        return embedding_function(texts)
+
+    def documents():
+        for i in range(100):
+            read.append(i)
+            yield Document(id=str(i), content=f"game number {i}")
+
+    store = NumpyVectorStore(embed)
+    report = store.ingest(documents(), batch_size=10, max_workers=2)
+
+    assert report.documents == 100
+    assert sorted(store.get()["ids"], key=int) == [str(i) for i in range(100)]
+    # The first batch is embedded long before the whole input is read
+    assert read_at_embed[0] <= 20
+
+
+def test_numpy_store_writes_once_per_ingest(tmp_path, monkeypatch):
+    path = str(tmp_path / "games")
+    store = NumpyVectorStore(HashingEmbeddingFunction(dimensions=64), path=path)
+    writes = []
+    dump = numpy_store.json.dump
+    monkeypatch.setattr(numpy_store.json, "dump", lambda *args, **kwargs: writes.append(1) or dump(*args, **kwargs))
+
+    store.ingest([Document(id=str(i), content=f"game number {i}") for i in range(50)], batch_size=5)
+
+    assert len(writes) == 1
+    reopened = NumpyVectorStore(HashingEmbeddingFunction(dimensions=64), path=path)
+    assert sorted(reopened.get()["ids"], key=int) == [str(i) for i in range(50)]
+
+
+def test_numpy_collection_persists_on_flush(tmp_path):
+    path = str(tmp_path / "games")
+    collection = NumpyCollection(HashingEmbeddingFunction(dimensions=64), path=path)
+
+    collection.upsert(ids=["mk10"], documents=["Mortal Kombat X"])
+    assert not (tmp_path / "games.json").exists()
+
+    collection.close()
+    assert NumpyCollection(path=path).get(ids=["mk10"])["documents"] == ["Mortal Kombat X"]